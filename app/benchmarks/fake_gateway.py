@@ -0,0 +1,157 @@
+"""
+Local stand-in for the MultiversX gateway and API.
+
+Answers the calls the game makes during a round: contract storage with
+--bettors open bets, account nonce and balance, transaction send and
+transaction status. Point ELROND_GATEWAY and ELROND_API at it:
+
+    python -m benchmarks.fake_gateway --port 7950 --bettors 100
+
+GET /paid counts the payout entries in transactions executed successfully.
+
+Transactions execute in nonce order, like on chain: one whose nonce is
+ahead waits for the ones before it, one whose nonce is used up is
+rejected, and submitting a waiting transaction again is a no-op. Executed
+transactions stay pending for --confirm-seconds, every --fail-every-th
+one fails on chain, and one over the gas limit is rejected like the real
+gateway does. With --lose-every N every Nth submitted transaction is
+taken but answered with an error, as if the response was lost. With
+--drop-every N every Nth one is answered with its hash but never
+executed or listed, as if the network dropped it.
+"""
+import argparse
+import base64
+import hashlib
+import json
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+BET_FUNDS_HEX = "bet_funds.mapped".encode().hex()
+HOUSE_BALANCE = 10 ** 6 * 10 ** 18
+MAX_GAS_LIMIT = 600000000
+
+
+def ok(data):
+    return {"data": data, "error": "", "code": "successful"}
+
+
+def make_app(bettors=100, bet_amount=1.0, confirm_seconds=0.0, fail_every=0, lose_every=0, drop_every=0):
+    app = FastAPI()
+    pairs = {
+        BET_FUNDS_HEX + hashlib.sha256(str(i).encode()).hexdigest(): hex(int(bet_amount * 10 ** 18))[2:]
+        for i in range(bettors)
+    }
+    # the account nonce, counts of submitted and executed transactions
+    # and of the payout entries executed successfully
+    account = {"nonce": 0, "submitted": 0, "executed": 0, "paid": 0}
+    waiting = {}
+    transactions = {}
+
+    def execute():
+        while account["nonce"] in waiting:
+            tx = transactions[waiting.pop(account["nonce"])]
+            account["executed"] += 1
+            failed = bool(fail_every) and account["executed"] % fail_every == 0
+            tx.update(status="fail" if failed else "success", done_at=time.monotonic() + confirm_seconds)
+            if not failed:
+                account["paid"] += tx["entries"]
+            account["nonce"] += 1
+
+    def rejected(error):
+        return JSONResponse({"data": None, "error": error, "code": "bad_request"}, status_code=400)
+
+    @app.get("/address/{address}/keys")
+    async def keys(address: str):
+        return ok({"pairs": pairs})
+
+    @app.get("/address/{address}/nonce")
+    async def nonce(address: str):
+        return ok({"nonce": account["nonce"]})
+
+    @app.get("/address/{address}")
+    async def balance(address: str):
+        return ok({"account": {"address": address, "nonce": account["nonce"], "balance": str(HOUSE_BALANCE)}})
+
+    @app.post("/transaction/send")
+    async def send(request: Request):
+        tx = await request.json()
+        if tx.get("gasLimit", 0) > MAX_GAS_LIMIT:
+            return rejected("transaction generation failed: higher gas limit required")
+
+        tx_hash = hashlib.sha256(json.dumps(tx, sort_keys=True).encode()).hexdigest()
+        if tx["nonce"] < account["nonce"]:
+            return rejected("transaction generation failed: lowerNonceInTransaction")
+        if tx_hash in transactions:
+            return ok({"txHash": tx_hash})
+        if tx["nonce"] in waiting:
+            return rejected("transaction generation failed: nonce already taken")
+
+        account["submitted"] += 1
+        if drop_every and account["submitted"] % drop_every == 0:
+            return ok({"txHash": tx_hash})
+        waiting[tx["nonce"]] = tx_hash
+        transactions[tx_hash] = {
+            "txHash": tx_hash,
+            "nonce": tx["nonce"],
+            "entries": payout_entries(tx),
+            "status": "pending",
+            "done_at": None,
+        }
+        execute()
+        if lose_every and account["submitted"] % lose_every == 0:
+            return JSONResponse({"data": None, "error": "response lost", "code": "internal_issue"}, status_code=503)
+        return ok({"txHash": tx_hash})
+
+    @app.get("/transactions/{tx_hash}")
+    async def transaction(tx_hash: str):
+        tx = transactions.get(tx_hash)
+        if tx is None:
+            return JSONResponse({"statusCode": 404, "message": "Transaction not found"}, status_code=404)
+        status = tx["status"]
+        if tx["done_at"] is None or time.monotonic() < tx["done_at"]:
+            status = "pending"
+        return {"txHash": tx_hash, "nonce": tx["nonce"], "status": status}
+
+    @app.get("/accounts/{address}/transactions")
+    async def account_transactions(address: str, size: int = 25):
+        executed = sorted(
+            (tx for tx in transactions.values() if tx["done_at"] is not None), key=lambda tx: -tx["nonce"]
+        )
+        return [{"txHash": tx["txHash"], "nonce": tx["nonce"], "status": tx["status"]} for tx in executed[:size]]
+
+    @app.get("/paid")
+    async def paid():
+        return {"entries": account["paid"], "transactions": account["executed"]}
+
+    return app
+
+
+def payout_entries(tx):
+    # multiplyFunds@<address>@<multiplier>...
+    data = base64.b64decode(tx.get("data", "")).decode()
+    return data.count("@") // 2
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7950)
+    parser.add_argument("--bettors", type=int, default=100)
+    parser.add_argument("--bet-amount", type=float, default=1.0)
+    parser.add_argument("--confirm-seconds", type=float, default=0.0)
+    parser.add_argument("--fail-every", type=int, default=0)
+    parser.add_argument("--lose-every", type=int, default=0)
+    parser.add_argument("--drop-every", type=int, default=0)
+    args = parser.parse_args()
+
+    app = make_app(
+        args.bettors, args.bet_amount, args.confirm_seconds, args.fail_every, args.lose_every, args.drop_every
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""
+Benchmarks of the code that runs every tick and every round.
+
+Runs offline: the chain, the HTTP gateway and Postgres are replaced by
+benchmarks.stubs. Bet book paths are timed for each --bets count and
+GameHistory.get_last_game_bets for each --history size (rows in the
+stubbed bets table). GameHistory only imports the newest
+BETS_HISTORY_WINDOW bets, so larger tables time the same frame and
+sizes above the window are skipped.
+
+    python -m benchmarks.hot_paths --save baseline.json
+    python -m benchmarks.hot_paths --compare baseline.json --tolerance 0.25
+
+With --compare the run exits with status 1 if any benchmark's median is
+slower than the baseline by more than the tolerance.
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+
+from benchmarks import stubs
+
+stubs.install()
+
+import numpy as np  # noqa: E402
+
+from database import GameHistory  # noqa: E402
+from objects import Bet, Bets, Game  # noqa: E402
+from vars import BETS_HISTORY_WINDOW  # noqa: E402
+
+BET_COUNTS = [10, 100, 1000, 10000, 100000]
+HISTORY_SIZES = [1000, 10000, BETS_HISTORY_WINDOW]
+# share of the bets whose amount changes between two chain polls
+POLL_CHANGED = 0.01
+MIN_RUN_SECONDS = 0.2
+REPEATS = 5
+
+
+def make_bets(n):
+    return [Bet(stubs._address(i), 1.0 + i % 7) for i in range(n)]
+
+
+def filled_book(n):
+    book = Bets()
+    for bet in make_bets(n):
+        book.add_bet(bet)
+    return book
+
+
+def bench_add_bet(game, n):
+    bets = make_bets(n)
+
+    def run():
+        book = Bets()
+        for bet in bets:
+            book.add_bet(bet)
+
+    return run
+
+
+def bench_update(game, n):
+    new_bets = {bet.address: bet.amount for bet in make_bets(n)}
+
+    def run():
+        Bets().update(new_bets)
+
+    return run
+
+
+def bench_update_poll(game, n):
+    book = filled_book(n)
+    poll = {bet.address: bet.amount for bet in make_bets(n)}
+    raised = dict(poll)
+    for address in list(raised)[::max(1, int(1 / POLL_CHANGED))]:
+        raised[address] += 1.0
+    # alternate the two polls, so every call changes the same amounts
+    polls = [raised, poll]
+
+    def run():
+        polls.reverse()
+        book.update(polls[0])
+
+    return run
+
+
+def bench_iterate_game(game, n):
+    game.bets = filled_book(n)
+    game.state = "play"
+    game.multiplier = 400
+    game.forced_change = True
+    game.house_balance = 1e12
+    game.reset_clock()
+
+    def run():
+        game.runtime_index = 0
+        game.iterate_game()
+
+    return run
+
+
+def bench_get_current_bets(game, n):
+    game.bets = filled_book(n)
+    game.multiplier_now = 2.0
+    return game.get_current_bets
+
+
+def bench_force_cashout(game, n):
+    game.bets = filled_book(n)
+
+    def run():
+        game.bets.is_open[:n] = True
+        game.bets.open_count = n
+        game.force_cashout()
+
+    return run
+
+
+def bench_to_list_of_tuples(game, n):
+    book = filled_book(n)
+    book.close_all(2.0)
+    return lambda: book.to_list_of_tuples(game.hash)
+
+
+BET_BENCHMARKS = {
+    "Bets.add_bet": bench_add_bet,
+    "Bets.update": bench_update,
+    "Bets.update_poll": bench_update_poll,
+    "Game.iterate_game": bench_iterate_game,
+    "Game.get_current_bets": bench_get_current_bets,
+    "Game.force_cashout": bench_force_cashout,
+    "Bets.to_list_of_tuples": bench_to_list_of_tuples,
+}
+
+
+def timed(func):
+    """
+    Returns (median, min) seconds per call and the calls per repeat
+    """
+    start = time.perf_counter()
+    func()
+    once = max(time.perf_counter() - start, 1e-7)
+    calls = max(1, int(MIN_RUN_SECONDS / once))
+
+    samples = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        for _ in range(calls):
+            func()
+        samples.append((time.perf_counter() - start) / calls)
+    return statistics.median(samples), min(samples), calls
+
+
+def run(bet_counts, history_sizes, only=None):
+    results = {}
+
+    def record(name, func):
+        if only and only not in name:
+            return
+        median, best, calls = timed(func)
+        results[name] = {"median_s": median, "min_s": best, "calls": calls}
+        print(f"{name:<55}{median * 1e6:>14.1f}us{best * 1e6:>14.1f}us")
+
+    print(f"{'benchmark':<55}{'median':>16}{'min':>16}")
+    game = Game()
+    for name, bench in BET_BENCHMARKS.items():
+        for n in bet_counts:
+            record(f"{name}[bets={n}]", bench(game, n))
+
+    for rows in history_sizes:
+        if rows > BETS_HISTORY_WINDOW:
+            print(f"history={rows} skipped, only the newest {BETS_HISTORY_WINDOW} bets are imported")
+            continue
+        stubs.StubDatabase.history_rows = rows
+        history = GameHistory()
+
+        def cold():
+            history.set_last_game_bets(None)
+            history.get_last_game_bets()
+
+        record(f"GameHistory.get_last_game_bets[history={rows},cold]", cold)
+        record(f"GameHistory.get_last_game_bets[history={rows},warm]", history.get_last_game_bets)
+
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+
+def compare(report, baseline, tolerance):
+    """
+    Returns the names of the benchmarks slower than baseline by more than
+    tolerance
+    """
+    regressions = []
+    for name, res in report["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        ratio = res["median_s"] / base["median_s"]
+        flag = "REGRESSION" if ratio > 1 + tolerance else ""
+        print(f"{name:<55}{ratio:>10.2f}x {flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bets", type=int, nargs="+", default=BET_COUNTS)
+    parser.add_argument("--history", type=int, nargs="+", default=HISTORY_SIZES)
+    parser.add_argument("--only", help="run only the benchmarks whose name contains this")
+    parser.add_argument("--save", help="write the results to this JSON baseline")
+    parser.add_argument("--compare", help="compare against this JSON baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    report = run(args.bets, args.history, only=args.only)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} benchmark(s) regressed by more than {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
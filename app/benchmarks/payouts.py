@@ -0,0 +1,142 @@
+"""
+Settlement time of large rounds against benchmarks.fake_gateway.
+
+Pays rounds of --sizes winners through SettlementQueue.settle, with
+every transaction pending for --confirm-seconds on the fake gateway.
+Each round is paid twice: one chunk at a time, sending and confirming
+each before the next (how the payouts would go without batching), and
+all chunks signed with local nonces and submitted and confirmed
+together. With --fail-every N every Nth transaction fails on chain and
+only those chunks are paid again; with --lose-every N every Nth
+submission is taken but answered with an error; with --drop-every N
+every Nth one is never executed and is submitted again once
+--confirm-timeout passes. After each run the gateway's count of paid
+entries is checked against the winners, so a chunk paid twice fails
+the run.
+
+Run from the app directory, the house wallet is read from wallet.pem:
+
+    python -m benchmarks.payouts --sizes 10 1000 5000 --confirm-seconds 1
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from benchmarks import stubs
+from benchmarks.ws_load import APP_DIR, free_port, wait_http
+
+
+def addresses(n):
+    from erdpy.accounts import Address
+
+    return [Address(i.to_bytes(32, "big")).bech32() for i in range(1, n + 1)]
+
+
+def settlements(game_id, payouts, sequential):
+    from payouts import chunk_payouts
+    from settlement import Settlement
+
+    game_row = (game_id, datetime.now().isoformat(), "", "", 0.0, 2.0, 0.0, 0.0)
+    if not sequential:
+        return [Settlement.for_round(game_id, payouts, game_row, [])]
+    return [Settlement.for_round(game_id, part, game_row, []) for part in chunk_payouts(payouts)]
+
+
+async def paid_entries(url):
+    from gateway import gateway
+
+    return (await gateway.get_json(url + "/paid"))["entries"]
+
+
+async def run(url, sizes, sequential_max, confirm_timeout):
+    from database import GameHistory
+    from gateway import gateway
+    from payouts import PayoutBatcher
+    from settlement import SettlementQueue
+
+    class CountingBatcher(PayoutBatcher):
+        signed = 0
+
+        async def sign(self, chunks, min_nonce=0):
+            self.signed += len(chunks)
+            return await super().sign(chunks, min_nonce)
+
+    batcher = CountingBatcher(retry_delay=0.1, confirm_timeout=confirm_timeout)
+    queue = SettlementQueue(GameHistory(), batcher=batcher, retry_delay=0.1)
+    results = []
+    game_id = 0
+    try:
+        for size in sizes:
+            payouts = dict.fromkeys(addresses(size), 2.0)
+            for mode in ["sequential", "batched"]:
+                if mode == "sequential" and size > sequential_max:
+                    continue
+                paid_before = await paid_entries(url)
+                signed_before = batcher.signed
+                start = time.perf_counter()
+                chunks = 0
+                for settlement in settlements(game_id, payouts, mode == "sequential"):
+                    await queue.settle(settlement)
+                    chunks += len(settlement.chunks)
+                    game_id += 1
+                seconds = time.perf_counter() - start
+                await asyncio.sleep(0.1)
+                paid = await paid_entries(url) - paid_before
+                results.append({
+                    "winners": size,
+                    "mode": mode,
+                    "chunks": chunks,
+                    "transactions": batcher.signed - signed_before,
+                    "paidEntries": paid,
+                    "seconds": round(seconds, 3),
+                })
+                print(json.dumps(results[-1]))
+                if paid != size:
+                    raise SystemExit(f"{paid} entries paid for {size} winners")
+    finally:
+        await gateway.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 5000])
+    parser.add_argument("--confirm-seconds", type=float, default=1.0)
+    parser.add_argument("--fail-every", type=int, default=0)
+    parser.add_argument("--lose-every", type=int, default=0)
+    parser.add_argument("--drop-every", type=int, default=0)
+    parser.add_argument("--confirm-timeout", type=float, default=5.0)
+    parser.add_argument(
+        "--sequential-max", type=int, default=1000, help="skip the one chunk at a time run above this many winners"
+    )
+    args = parser.parse_args()
+
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    os.environ["ELROND_GATEWAY"] = os.environ["ELROND_API"] = url
+    os.environ.setdefault("SC_ADDRESS", addresses(1)[0])
+    stubs.install_database()
+
+    gateway_proc = subprocess.Popen(
+        [
+            sys.executable, "-m", "benchmarks.fake_gateway", "--port", str(port), "--bettors", "0",
+            "--confirm-seconds", str(args.confirm_seconds), "--fail-every", str(args.fail_every),
+            "--lose-every", str(args.lose_every), "--drop-every", str(args.drop_every),
+        ],
+        cwd=APP_DIR,
+    )
+    try:
+        wait_http(f"{url}/address/probe/nonce")
+        asyncio.run(run(url, args.sizes, args.sequential_max, args.confirm_timeout))
+    finally:
+        gateway_proc.terminate()
+        gateway_proc.wait()
+
+
+if __name__ == "__main__":
+    main()
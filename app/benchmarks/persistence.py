@@ -0,0 +1,93 @@
+"""
+Benchmark of the round persistence paths against a live Postgres.
+
+Compares writing a round row by row with ElrondCrashDatabase.add_row
+(one INSERT and one commit per bet) against the batched
+ElrondCrashDatabase.save_round. Rows go to scratch copies of the games
+and bets tables, which are dropped afterwards.
+
+Run from the app directory with the usual DB_* environment:
+
+    python -m benchmarks.persistence --sizes 10 1000 100000
+"""
+import argparse
+import time
+from datetime import datetime
+
+from database import ElrondCrashDatabase
+from vars import GAMES_TABLE_NAME, BETS_TABLE_NAME
+
+BENCH_GAMES_TABLE = "bench_" + GAMES_TABLE_NAME
+BENCH_BETS_TABLE = "bench_" + BETS_TABLE_NAME
+
+
+def make_round(n_bets, game_id=0):
+    timestamp = datetime.now().isoformat()
+    gamehash = f"{game_id:064x}"
+    game_row = (game_id, timestamp, gamehash, "", float(n_bets), 2.0, 0.0, 100.0)
+    bet_rows = [
+        (timestamp, gamehash, f"erd1bench{i:053d}", 1.0, i % 2 == 0, 0, 1.0, "closed")
+        for i in range(n_bets)
+    ]
+    return game_row, bet_rows
+
+
+def create_tables(db):
+    db.execute(f"CREATE TABLE IF NOT EXISTS {BENCH_GAMES_TABLE} (LIKE {GAMES_TABLE_NAME} INCLUDING ALL);")
+    db.execute(f"CREATE TABLE IF NOT EXISTS {BENCH_BETS_TABLE} (LIKE {BETS_TABLE_NAME} INCLUDING ALL);")
+
+
+def drop_tables(db):
+    db.execute(f"DROP TABLE IF EXISTS {BENCH_GAMES_TABLE};")
+    db.execute(f"DROP TABLE IF EXISTS {BENCH_BETS_TABLE};")
+
+
+def row_by_row(db, game_row, bet_rows):
+    db.add_row(BENCH_GAMES_TABLE, game_row)
+    for row in bet_rows:
+        db.add_row(BENCH_BETS_TABLE, row)
+
+
+def batched(db, game_row, bet_rows):
+    db.save_round(game_row, bet_rows, games_table=BENCH_GAMES_TABLE, bets_table=BENCH_BETS_TABLE)
+
+
+def run(sizes, skip_row_by_row_above):
+    db = ElrondCrashDatabase()
+    create_tables(db)
+    results = []
+
+    try:
+        for i, n_bets in enumerate(sizes):
+            game_row, bet_rows = make_round(n_bets, game_id=i)
+            paths = [("batched", batched)]
+            if n_bets <= skip_row_by_row_above:
+                paths.insert(0, ("row_by_row", row_by_row))
+
+            for name, path in paths:
+                start = time.perf_counter()
+                path(db, game_row, bet_rows)
+                elapsed = time.perf_counter() - start
+                results.append({"path": name, "bets": n_bets, "seconds": elapsed})
+                print(f"{name:>12}\t{n_bets:>8} bets\t{elapsed * 1000:10.1f} ms")
+    finally:
+        drop_tables(db)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 100000])
+    parser.add_argument(
+        "--skip-row-by-row-above",
+        type=int,
+        default=100000,
+        help="only run the batched path for rounds larger than this",
+    )
+    args = parser.parse_args()
+    run(args.sizes, args.skip_row_by_row_above)
+
+
+if __name__ == "__main__":
+    main()
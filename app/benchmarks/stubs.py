@@ -0,0 +1,248 @@
+"""
+Offline stand-ins for the chain, the HTTP gateway and Postgres.
+
+install() has to run before objects or main are imported: it registers
+an elrond module that never touches the network, makes the gateway
+answer every request with an empty payload and swaps
+database.ElrondCrashDatabase for StubDatabase, which serves synthetic
+games, bets and users instead of querying a server. install_database()
+swaps only the database, for runs that talk to a fake gateway instead,
+and install_chain() only the chain and the gateway, for runs on a real
+storage backend.
+"""
+import os
+import sys
+import types
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+os.environ.setdefault("HASH", "benchmark-seed")
+
+BETS_PER_GAME = 10
+STUB_USERS = 1000
+
+
+def _address(i):
+    return f"erd1stub{i:054d}"
+
+
+class StubPool:
+    def metrics(self):
+        return {}
+
+    def close(self):
+        pass
+
+
+class StubDatabase:
+    """
+    In-memory ElrondCrashDatabase with history_rows bets in the bets
+    table. Only the requested window is generated, so very large
+    histories cost nothing until they are read.
+    """
+
+    history_rows = 1000
+
+    def __init__(self):
+        from vars import DATABASE_MAP, DATABASE_PATH
+
+        self.db_name = DATABASE_PATH
+        self.map = DATABASE_MAP
+        self.pool = StubPool()
+        self.saved_rounds = 0
+
+    def pool_metrics(self):
+        return self.pool.metrics()
+
+    def ensure_indexes(self):
+        pass
+
+    def create_table(self, table, cols, pkey=False):
+        pass
+
+    def execute(self, sql, params=None):
+        return []
+
+    def ensure_settlements_table(self):
+        pass
+
+    def add_settlement(self, row):
+        pass
+
+    def update_settlement(self, settlement_id, status, chunks, tx_hash, attempts):
+        pass
+
+    def pending_settlements(self):
+        return pd.DataFrame()
+
+    def add_row(self, table, data):
+        pass
+
+    def add_rows(self, table, rows):
+        pass
+
+    def save_round(self, game_row, bet_rows, **kwargs):
+        self.saved_rounds += 1
+
+    def get_table(self, table, limit=-1):
+        from vars import GAMES_TABLE_NAME, BETS_TABLE_NAME
+
+        if table == GAMES_TABLE_NAME:
+            rows = max(1, self.history_rows // BETS_PER_GAME)
+            builder = games_frame
+        elif table == BETS_TABLE_NAME:
+            rows = self.history_rows
+            builder = bets_frame
+        else:
+            rows = STUB_USERS
+            builder = users_frame
+
+        if limit > 0:
+            rows = min(rows, limit)
+        # newest first, like ORDER BY timestamp DESC
+        return builder(rows).iloc[::-1].reset_index(drop=True)
+
+    def read_sql(self, sql, params=None):
+        if "volume" in sql:
+            return pd.DataFrame(columns=["day", "address", "volume", "profit"])
+        return pd.DataFrame()
+
+
+def _timestamps(n, step):
+    start = datetime.now() - timedelta(seconds=step * n)
+    return [(start + timedelta(seconds=step * i)).isoformat() for i in range(n)]
+
+
+def games_frame(n):
+    rng = np.random.default_rng(0)
+    return pd.DataFrame(
+        {
+            "id": np.arange(n),
+            "timestamp": _timestamps(n, 40),
+            "hash": [f"{i:064x}" for i in range(n)],
+            "tx_hash": "",
+            "pool_size": rng.uniform(0, 100, n).round(2),
+            "multiplier": rng.uniform(1, 10, n).round(2),
+            "house_profit": rng.uniform(-50, 50, n).round(2),
+            "house_balance": 1000.0,
+        }
+    )
+
+
+def bets_frame(n):
+    rng = np.random.default_rng(1)
+    amounts = rng.uniform(0.1, 10, n).round(2)
+    haswon = rng.random(n) < 0.5
+    return pd.DataFrame(
+        {
+            "timestamp": _timestamps(n, 4),
+            "hash": [f"{i // BETS_PER_GAME:064x}" for i in range(n)],
+            "address": [_address(i % STUB_USERS) for i in range(n)],
+            "amount": amounts,
+            "haswon": haswon,
+            "multiplier": 0,
+            "profit": np.where(haswon, amounts * 2, -amounts),
+            "status": "closed",
+        }
+    )
+
+
+def users_frame(n):
+    return pd.DataFrame(
+        {
+            "id": np.arange(n),
+            "timestamp": _timestamps(n, 60),
+            "address": [_address(i) for i in range(n)],
+            "discord_name": "",
+            "discord_id": 0,
+            "avatar_hash": "",
+            "exp": 0,
+            "raffle_tickets": 0,
+            "is_private": True,
+            "has_title": False,
+            "title": "",
+        }
+    )
+
+
+def seed(db, history_rows=1000):
+    """
+    Writes the synthetic history StubDatabase serves into a real storage
+    backend, e.g. a SQLiteDatabase
+    """
+    from vars import GAMES_TABLE_NAME, BETS_TABLE_NAME, USERS_TABLE_NAME
+
+    tables = [
+        (GAMES_TABLE_NAME, games_frame(max(1, history_rows // BETS_PER_GAME))),
+        (BETS_TABLE_NAME, bets_frame(history_rows)),
+        (USERS_TABLE_NAME, users_frame(STUB_USERS)),
+    ]
+    for table, df in tables:
+        db.add_rows(table, list(df.itertuples(index=False, name=None)))
+
+
+def _elrond_module():
+    module = types.ModuleType("elrond")
+
+    async def get_all_bets():
+        return {}
+
+    async def get_all_rewards():
+        return {}
+
+    async def get_nonce(address):
+        return 0
+
+    async def find_transaction(sender, nonce):
+        return None
+
+    async def confirm_transaction(tx_hash, timeout=None):
+        return True
+
+    def rewards_transaction(account, payouts, nonce):
+        return {"nonce": nonce, "sender": account.address.bech32(), "entries": len(payouts)}
+
+    async def send_transaction(payload):
+        return f"{payload['nonce']:064x}"
+
+    def connect():
+        return module.elrond_proxy, module.elrond_account
+
+    module.get_all_bets = get_all_bets
+    module.get_all_rewards = get_all_rewards
+    module.get_nonce = get_nonce
+    module.find_transaction = find_transaction
+    module.confirm_transaction = confirm_transaction
+    module.rewards_transaction = rewards_transaction
+    module.send_transaction = send_transaction
+    module.REWARD_GAS_PER_ENTRY = 6000000
+    module.MAX_GAS_LIMIT = 600000000
+    module.connect = connect
+    module.elrond_proxy = None
+    module.elrond_account = types.SimpleNamespace(address=types.SimpleNamespace(bech32=lambda: _address(0)))
+    return module
+
+
+def install_database(history_rows=1000):
+    import database
+
+    StubDatabase.history_rows = history_rows
+    database.ElrondCrashDatabase = StubDatabase
+
+
+def install_chain():
+    sys.modules["elrond"] = _elrond_module()
+
+    from gateway import gateway
+
+    async def get_json(url):
+        return {"data": {}}
+
+    gateway.get_json = get_json
+
+
+def install(history_rows=1000):
+    install_chain()
+    install_database(history_rows)
@@ -0,0 +1,140 @@
+"""
+Measures game tick jitter while history requests are in flight.
+
+A Game on the SQLite storage backend, seeded with --history-rows
+synthetic bets, plays one long round driven by scheduler.RoundScheduler
+while batches of concurrent history requests run: the GameHistory
+methods behind /userProfile, /getPlayerWeeklyStats and
+/getUserLastTenBets, each for a different address so the player cache
+does not answer them. The same load runs twice: inline on the event
+loop (the old behaviour of the async endpoints) and through
+GameHistory.run, as the endpoints call them. Jitter is how far the time
+between two ticks was from TICK_INTERVAL. The chain and the gateway
+are stubbed, no server is needed.
+
+    python -m benchmarks.tick_jitter --requests 100 --max-jitter-ms 10
+
+Exits with status 1 if the executor run exceeds --max-jitter-ms.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+
+from benchmarks import stubs
+
+os.environ["STORAGE_BACKEND"] = "sqlite"
+os.environ.setdefault("SQLITE_PATH", os.path.join(tempfile.mkdtemp(), "history.sqlite"))
+stubs.install_chain()
+
+from database import GameHistory  # noqa: E402
+from objects import Game  # noqa: E402
+from scheduler import RoundScheduler, TickScheduler  # noqa: E402
+from sqlite_storage import SQLiteDatabase  # noqa: E402
+from vars import TICK_INTERVAL  # noqa: E402
+
+QUERIES = ["get_user_profile", "get_player_weekly_stats", "get_user_last_bets"]
+
+
+class RecordingTicks(TickScheduler):
+    """
+    Records the time between consecutive ticks. Lateness behind the
+    grid would hide a stall: the scheduler skips the grid points it
+    missed, so the tick after a stall is never more than an interval late.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.intervals = []
+
+    async def wait(self):
+        last_fired = self.last_fired
+        index = await super().wait()
+        if last_fired is not None:
+            self.intervals.append(self.last_fired - last_fired)
+        return index
+
+
+def long_round(game):
+    """
+    Puts the game in play with a crash point that is not reached
+    during the run
+    """
+    setattr(game, "multiplier", 1e9)
+    setattr(game, "forced_change", True)
+    game.toggle_state()
+
+
+async def measure(game, n_requests, offload, batches):
+    history = game.data
+    history.player_cache.invalidate(list(history.player_cache.entries))
+    long_round(game)
+
+    rounds = RoundScheduler(game)
+    ticks = rounds.ticks = RecordingTicks(TICK_INTERVAL)
+    task = asyncio.create_task(rounds.run())
+
+    await asyncio.sleep(TICK_INTERVAL * 5)
+    ticks.intervals.clear()
+    for batch in range(batches):
+        requests = []
+        for i in range(n_requests):
+            query = getattr(history, QUERIES[i % len(QUERIES)])
+            address = stubs._address((batch * n_requests + i) % stubs.STUB_USERS)
+            if offload:
+                requests.append(history.run(query, address))
+            else:
+                requests.append(inline_request(query, address))
+        await asyncio.gather(*requests)
+    await asyncio.sleep(TICK_INTERVAL * 5)
+
+    task.cancel()
+    setattr(game, "state", "end")
+    jitter = sorted(abs(interval - TICK_INTERVAL) * 1000 for interval in ticks.intervals)
+    return {
+        "ticks": len(jitter),
+        "p50_ms": jitter[len(jitter) // 2],
+        "p99_ms": jitter[min(len(jitter) - 1, int(len(jitter) * 0.99))],
+        "max_ms": jitter[-1],
+    }
+
+
+async def inline_request(query, address):
+    return query(address)
+
+
+async def run(n_requests, batches):
+    game = Game(GameHistory())
+    results = {}
+    for name, offload in [("inline", False), ("executor", True)]:
+        game.new_round()
+        results[name] = await measure(game, n_requests, offload, batches)
+    game.data.executor.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100, help="concurrent requests per batch")
+    parser.add_argument("--batches", type=int, default=5)
+    parser.add_argument("--history-rows", type=int, default=200000)
+    parser.add_argument("--max-jitter-ms", type=float, default=10)
+    args = parser.parse_args()
+
+    if not os.path.exists(os.environ["SQLITE_PATH"]) or os.path.getsize(os.environ["SQLITE_PATH"]) == 0:
+        stubs.seed(SQLiteDatabase(), args.history_rows)
+
+    results = asyncio.run(run(args.requests, args.batches))
+    for name, res in results.items():
+        print(
+            f"{name:>9}\tticks={res['ticks']}\tp50={res['p50_ms']:.2f}ms"
+            f"\tp99={res['p99_ms']:.2f}ms\tmax={res['max_ms']:.2f}ms"
+        )
+
+    if results["executor"]["max_ms"] > args.max_jitter_ms:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
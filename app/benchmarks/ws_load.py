@@ -0,0 +1,278 @@
+"""
+End-to-end websocket load test.
+
+Boots main.app in its own process against benchmarks.fake_gateway and
+the SQLite storage backend, seeded with --history-rows synthetic bets,
+opens --clients websocket spectators spread
+over --client-procs processes and listens through --cycles full
+bet -> play -> end cycles (or --duration seconds, whichever comes
+first). The server runs with BROADCAST_TIMESTAMPS=1, so every delta
+carries its emit time and latency is measured per frame.
+
+Reports frame latency percentiles, per-client frame rates, the interval
+between consecutive server ticks (ticks slipping behind TICK_INTERVAL
+show up here) and the server's CPU use from /proc.
+
+    python -m benchmarks.ws_load --clients 2000 --client-procs 4 --bet-seconds 5
+
+Thousands of sockets need a matching open files limit (ulimit -n).
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import numpy as np
+from erdpy.accounts import Address
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONNECT_BATCH = 200
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_http(url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=2):
+                return
+        except Exception:
+            time.sleep(0.2)
+    raise TimeoutError(f"{url} did not come up in {timeout}s")
+
+
+def cpu_seconds(pid):
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    # utime and stime, fields 14 and 15 of the full line
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def rss_mb(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def serve(port):
+    import uvicorn
+    import main
+
+    uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning", ws="websockets")
+
+
+async def client(url, stats, results_seen, stop):
+    import websockets
+
+    frames = 0
+    first = last = None
+    try:
+        async with websockets.connect(url, max_size=None, ping_interval=None) as sock:
+            while not stop.is_set():
+                try:
+                    raw = await asyncio.wait_for(sock.recv(), timeout=1)
+                except asyncio.TimeoutError:
+                    continue
+                now = time.time()
+                frame = json.loads(raw)
+                frames += 1
+                first = first or now
+                last = now
+
+                kind = frame.get("type")
+                stats["types"][kind] = stats["types"].get(kind, 0) + 1
+                if "ts" in frame:
+                    stats["latencies"].append(now - frame["ts"])
+                if kind == "result":
+                    results_seen.append(now)
+    except Exception:
+        stats["failed"] += 1
+        return
+
+    if first is not None and last > first:
+        stats["rates"].append(frames / (last - first))
+
+
+async def run_clients(url, n_clients, cycles, duration):
+    stats = {"latencies": [], "rates": [], "types": {}, "failed": 0}
+    results_seen = []
+    stop = asyncio.Event()
+
+    tasks = []
+    for start in range(0, n_clients, CONNECT_BATCH):
+        for _ in range(min(CONNECT_BATCH, n_clients - start)):
+            tasks.append(asyncio.create_task(client(url, stats, results_seen, stop)))
+        await asyncio.sleep(0.05)
+
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        if len(results_seen) >= cycles * max(1, n_clients - stats["failed"]):
+            break
+        await asyncio.sleep(0.25)
+
+    stop.set()
+    await asyncio.gather(*tasks)
+    stats["connected"] = n_clients - stats["failed"]
+    return stats
+
+
+def client_process(args):
+    url, n_clients, cycles, duration = args
+    return asyncio.run(run_clients(url, n_clients, cycles, duration))
+
+
+async def probe_ticks(url, duration, stop_after_results):
+    """
+    One extra client that keeps the server emit times of tick frames
+    """
+    import websockets
+
+    ticks = []
+    results = 0
+    deadline = time.monotonic() + duration
+    async with websockets.connect(url, max_size=None, ping_interval=None) as sock:
+        while time.monotonic() < deadline and results < stop_after_results:
+            try:
+                frame = json.loads(await asyncio.wait_for(sock.recv(), timeout=1))
+            except asyncio.TimeoutError:
+                continue
+            if frame.get("type") == "tick" and "ts" in frame:
+                ticks.append(frame["ts"])
+            elif frame.get("type") == "result":
+                results += 1
+    return ticks
+
+
+def percentiles(values, points=(50, 95, 99)):
+    if len(values) == 0:
+        return {}
+    result = {f"p{p}": float(v) for p, v in zip(points, np.percentile(values, points))}
+    result["max"] = float(np.max(values))
+    return result
+
+
+def seed_history(path, history_rows):
+    from benchmarks import stubs
+    from sqlite_storage import SQLiteDatabase
+
+    db = SQLiteDatabase(path)
+    stubs.seed(db, history_rows)
+    db.pool.close()
+
+
+def load_test(args):
+    gateway_port = free_port()
+    server_port = free_port()
+    history = tempfile.NamedTemporaryFile(suffix=".sqlite", delete=False)
+    history.close()
+    seed_history(history.name, args.history_rows)
+
+    env = dict(
+        os.environ,
+        ELROND_GATEWAY=f"http://127.0.0.1:{gateway_port}",
+        ELROND_API=f"http://127.0.0.1:{gateway_port}",
+        BROADCAST_TIMESTAMPS="1",
+        BETTING_STAGE_DURATION=str(args.bet_seconds),
+        STORAGE_BACKEND="sqlite",
+        SQLITE_PATH=history.name,
+    )
+    env.setdefault("HASH", "load-test-seed")
+    env.setdefault("SC_ADDRESS", Address("00" * 32).bech32())
+
+    procs = []
+    try:
+        procs.append(subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.fake_gateway", "--port", str(gateway_port), "--bettors", str(args.bettors)],
+            cwd=APP_DIR, env=env,
+        ))
+        wait_http(f"http://127.0.0.1:{gateway_port}/address/probe/nonce")
+
+        server = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.ws_load", "--serve", "--port", str(server_port)],
+            cwd=APP_DIR, env=env,
+        )
+        procs.append(server)
+        wait_http(f"http://127.0.0.1:{server_port}/ready")
+
+        url = f"ws://127.0.0.1:{server_port}/ws"
+        per_proc = np.array_split(np.arange(args.clients), args.client_procs)
+        jobs = [(url, len(chunk), args.cycles, args.duration) for chunk in per_proc if len(chunk)]
+
+        cpu_start = cpu_seconds(server.pid)
+        wall_start = time.monotonic()
+        with multiprocessing.Pool(len(jobs)) as pool:
+            pending = pool.map_async(client_process, jobs)
+            ticks = asyncio.run(probe_ticks(url, args.duration, args.cycles))
+            results = pending.get()
+        wall = time.monotonic() - wall_start
+        cpu = cpu_seconds(server.pid) - cpu_start
+        memory = rss_mb(server.pid)
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            proc.wait()
+        os.unlink(history.name)
+
+    latencies = np.concatenate([np.asarray(res["latencies"]) for res in results]) * 1000
+    rates = np.concatenate([np.asarray(res["rates"]) for res in results])
+    types = {}
+    for res in results:
+        for kind, count in res["types"].items():
+            types[kind] = types.get(kind, 0) + count
+
+    return {
+        "clients": args.clients,
+        "connected": sum(res["connected"] for res in results),
+        "wallSeconds": round(wall, 2),
+        "frames": int(sum(types.values())),
+        "framesByType": types,
+        "latencyMs": percentiles(latencies),
+        "clientFramesPerSecond": percentiles(rates, (5, 50, 95)),
+        "tickIntervalMs": percentiles(np.diff(ticks) * 1000),
+        "serverCpuPercent": round(100 * cpu / wall, 1),
+        "serverRssMb": round(memory, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--client-procs", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--cycles", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=300, help="upper bound on the listening time")
+    parser.add_argument("--bet-seconds", type=int, default=5, help="betting stage length of the booted server")
+    parser.add_argument("--bettors", type=int, default=100, help="open bets served by the fake gateway")
+    parser.add_argument("--history-rows", type=int, default=10000)
+    parser.add_argument("--out", help="also write the report to this JSON file")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port)
+        return
+
+    report = load_test(args)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Websocket broadcast hub and protocol.
+
+Every frame is a JSON object carrying the protocol version ``v``, a
+monotonically increasing ``seq`` and a ``type``:
+
+- ``snapshot``: full game state, sent once on connect and on resync
+- ``tick``: the multiplier moved
+- ``bet``: a bet was added or its amount changed
+- ``cashout``: a bet was cashed out
+- ``state``: the game state (or ``afterCrash``) changed
+- ``result``: a round ended, with its crash point and settled bets
+
+Deltas are applied on top of the last snapshot. A client that sees a gap
+in ``seq`` sends ``resync`` and receives a fresh snapshot.
+
+With BROADCAST_TIMESTAMPS set, every delta also carries ``ts``, the
+server's Unix time at emit, so load tests can measure frame latency.
+"""
+import asyncio
+import json
+import logging
+import time
+
+import metrics
+from vars import BROADCAST_TIMESTAMPS
+
+logger = logging.getLogger("fastapi")
+logger.setLevel(logging.DEBUG)
+
+PROTOCOL_VERSION = 2
+
+
+class BroadcastHub:
+    """
+    Fans a single pre-encoded frame out to every websocket subscriber.
+
+    Events are serialized once per emit, no matter how many sockets are
+    connected. A subscriber whose queue overflows has its backlog
+    replaced by a snapshot, so slow clients never stall the game loop.
+    """
+
+    def __init__(self, queue_size=256, timestamps=False):
+        self.queue_size = queue_size
+        self.timestamps = timestamps
+        self.subscribers = set()
+        self.seq = 0
+        self.snapshot_provider = None
+
+    def set_snapshot_provider(self, provider):
+        setattr(self, "snapshot_provider", provider)
+
+    def snapshot(self):
+        payload = {"v": PROTOCOL_VERSION, "seq": self.seq, "type": "snapshot"}
+        if self.snapshot_provider is not None:
+            payload.update(self.snapshot_provider())
+        return json.dumps(payload)
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        queue.put_nowait(self.snapshot())
+        self.subscribers.add(queue)
+        logger.debug(f"Websocket subscribed, total:\t{len(self.subscribers)}")
+        return queue
+
+    def unsubscribe(self, queue):
+        if queue not in self.subscribers:
+            return
+
+        self.subscribers.discard(queue)
+        _drain(queue)
+        queue.put_nowait(None)
+        logger.debug(f"Websocket unsubscribed, total:\t{len(self.subscribers)}")
+
+    def resync(self, queue):
+        if queue not in self.subscribers:
+            return
+
+        _drain(queue)
+        queue.put_nowait(self.snapshot())
+        metrics.ws_resyncs.inc()
+
+    def emit(self, event_type: str, **fields):
+        setattr(self, "seq", self.seq + 1)
+        payload = {"v": PROTOCOL_VERSION, "seq": self.seq, "type": event_type}
+        if self.timestamps:
+            payload["ts"] = time.time()
+        payload.update(fields)
+        frame = json.dumps(payload)
+
+        with metrics.ws_fanout.time():
+            for queue in self.subscribers:
+                if queue.full():
+                    self.resync(queue)
+                else:
+                    queue.put_nowait(frame)
+
+        return frame
+
+
+def _drain(queue):
+    while not queue.empty():
+        queue.get_nowait()
+
+
+hub = BroadcastHub(timestamps=BROADCAST_TIMESTAMPS)
+metrics.ws_clients.set_function(lambda: len(hub.subscribers))
@@ -0,0 +1,58 @@
+"""
+Closed-form multiplier curve.
+
+The multiplier is a pure function of the time elapsed since the round
+started. It grows linearly inside each segment, slowly at first and
+faster at higher multipliers, matching the pace of the old per-tick
+steps (0.01 every 70ms, 25ms and 10ms). Ticks only sample the curve, so
+a stalled event loop never slows the round down, and clients can
+extrapolate between frames from the same segments.
+"""
+import math
+
+# (multiplier at the start of the segment, growth per second)
+CURVE_SEGMENTS = [
+    (1.0, 0.01 / 0.07),
+    (2.0, 0.01 / 0.025),
+    (3.5, 0.01 / 0.01),
+]
+
+
+def _segment_starts():
+    starts = [0.0]
+    for (start_mult, rate), (next_mult, _) in zip(CURVE_SEGMENTS, CURVE_SEGMENTS[1:]):
+        starts.append(starts[-1] + (next_mult - start_mult) / rate)
+    return starts
+
+
+SEGMENT_START_TIMES = _segment_starts()
+
+
+def multiplier_at(elapsed: float) -> float:
+    """
+    Returns the multiplier reached after elapsed seconds, floored to
+    two decimals
+    """
+    if elapsed <= 0:
+        return 1.0
+
+    for (start_mult, rate), start_time, next_time in zip(
+            CURVE_SEGMENTS, SEGMENT_START_TIMES, SEGMENT_START_TIMES[1:] + [math.inf]
+    ):
+        if elapsed < next_time:
+            mult = start_mult + (elapsed - start_time) * rate
+            return math.floor(round(mult * 100, 6)) / 100
+
+
+def elapsed_at(multiplier: float) -> float:
+    """
+    Returns the seconds needed for the curve to reach multiplier
+    """
+    if multiplier <= 1:
+        return 0.0
+
+    elapsed = 0.0
+    for (start_mult, rate), start_time in zip(CURVE_SEGMENTS, SEGMENT_START_TIMES):
+        if multiplier >= start_mult:
+            elapsed = start_time + (multiplier - start_mult) / rate
+    return elapsed
@@ -1,4 +1,8 @@
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from leaderboard import WeeklyLeaderboard
+from player_index import PlayerIndex, USER_PROFILE_COLS
 from vars import (
     DATABASE_PATH,
     DATABASE_MAP,
@@ -9,9 +13,22 @@ from vars import (
     GAMES_TABLE_NAME,
     BETS_TABLE_NAME,
     USERS_TABLE_NAME,
+    SETTLEMENTS_TABLE_NAME,
+    GAMES_HISTORY_WINDOW,
+    BETS_HISTORY_WINDOW,
+    USERS_HISTORY_WINDOW,
+    PLAYER_CACHE_SIZE,
+    DB_POOL_MIN,
+    DB_POOL_MAX,
+    DB_HEALTHCHECK_INTERVAL,
+    STORAGE_BACKEND,
 )
-import psycopg2
+import metrics
 import pandas as pd
+import asyncio
+import functools
+import threading
+import time
 import warnings
 import logging
 
@@ -20,33 +37,252 @@ logger.setLevel(logging.DEBUG)
 warnings.filterwarnings("ignore", category=UserWarning, module="pandas")
 
 
+SETTLEMENT_COLUMNS = [
+    {"name": "id", "dtype": "INTEGER"},
+    {"name": "created", "dtype": "TEXT"},
+    {"name": "chunks", "dtype": "TEXT"},
+    {"name": "game_row", "dtype": "TEXT"},
+    {"name": "bet_rows", "dtype": "TEXT"},
+    {"name": "status", "dtype": "TEXT"},
+    {"name": "tx_hash", "dtype": "TEXT"},
+    {"name": "attempts", "dtype": "INTEGER"},
+]
+SETTLED_SQL = f"UPDATE {SETTLEMENTS_TABLE_NAME} SET status='settled' WHERE id=%s"
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of psycopg2 connections.
+
+    Connections are handed out per operation. A connection that was
+    closed, broke during an operation, or fails the health check after
+    being idle is discarded and transparently replaced. Callers wait for
+    a free connection instead of failing when the pool is exhausted.
+    """
+
+    def __init__(self, minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX, healthcheck_interval=DB_HEALTHCHECK_INTERVAL, **kwargs):
+        import psycopg2.pool
+
+        self.maxconn = maxconn
+        self.healthcheck_interval = healthcheck_interval
+        self.pool = psycopg2.pool.ThreadedConnectionPool(minconn, maxconn, **kwargs)
+        self.slots = threading.BoundedSemaphore(maxconn)
+        self.lock = threading.Lock()
+        self.last_used = {}
+        self.in_use = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.reconnects = 0
+
+    @contextmanager
+    def connection(self):
+        """
+        Yields a healthy connection. The transaction is committed when
+        the block succeeds and rolled back when it raises.
+        """
+        import psycopg2
+
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.waits += 1
+            self.slots.acquire()
+
+        conn = None
+        broken = False
+        try:
+            conn = self._checkout()
+            yield conn
+            conn.commit()
+        except (psycopg2.InterfaceError, psycopg2.OperationalError):
+            broken = True
+            raise
+        except Exception:
+            if conn is not None and not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            if conn is not None:
+                self._checkin(conn, broken)
+            self.slots.release()
+
+    def metrics(self):
+        return {
+            "size": self.maxconn,
+            "in_use": self.in_use,
+            "checkouts": self.checkouts,
+            "waits": self.waits,
+            "reconnects": self.reconnects,
+        }
+
+    def close(self):
+        self.pool.closeall()
+
+    def _checkout(self):
+        # after a server restart every idle connection is dead, so keep
+        # discarding until one passes. There are at most maxconn of them,
+        # after that getconn() opens a new connection
+        conn = self.pool.getconn()
+        for _ in range(self.maxconn):
+            if self._is_healthy(conn):
+                break
+            self.pool.putconn(conn, close=True)
+            self.last_used.pop(id(conn), None)
+            conn = self.pool.getconn()
+            with self.lock:
+                self.reconnects += 1
+            logger.warning("Replaced a dead database connection")
+
+        with self.lock:
+            self.in_use += 1
+            self.checkouts += 1
+        return conn
+
+    def _checkin(self, conn, broken):
+        with self.lock:
+            self.in_use -= 1
+            self.last_used[id(conn)] = time.monotonic()
+
+        close = broken or bool(conn.closed)
+        if close:
+            self.last_used.pop(id(conn), None)
+        self.pool.putconn(conn, close=close)
+
+    def _is_healthy(self, conn):
+        import psycopg2
+
+        if conn.closed:
+            return False
+
+        idle_since = self.last_used.get(id(conn))
+        if idle_since is not None and time.monotonic() - idle_since < self.healthcheck_interval:
+            return True
+
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except (psycopg2.InterfaceError, psycopg2.OperationalError):
+            return False
+
+
+class QueryExecutor:
+    """
+    Bounded thread pool for blocking database work.
+
+    Awaiting run() keeps the event loop, and therefore the game ticks and
+    websockets, free while a query waits on Postgres. The number of
+    workers matches the connection pool so a worker never waits for a
+    connection.
+    """
+
+    def __init__(self, max_workers=DB_POOL_MAX):
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db")
+
+    async def run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+class PlayerCache:
+    """
+    Per-address cache of player query results.
+
+    Entries are dropped when the address shows up in a saved round. A
+    result computed while an invalidation happened is not stored, so a
+    query that raced a round save never caches stale data.
+    """
+
+    def __init__(self, max_addresses=PLAYER_CACHE_SIZE):
+        self.max_addresses = max_addresses
+        self.entries = {}
+        self.versions = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_load(self, address, key, loader):
+        entry = self.entries.get(address)
+        if entry is not None and key in entry:
+            self.hits += 1
+            return entry[key]
+
+        self.misses += 1
+        version = self.versions.get(address, 0)
+        value = loader()
+        if self.versions.get(address, 0) == version:
+            if address not in self.entries and len(self.entries) >= self.max_addresses:
+                self.entries.pop(next(iter(self.entries)), None)
+            self.entries.setdefault(address, {})[key] = value
+        return value
+
+    def invalidate(self, addresses):
+        for address in addresses:
+            self.versions[address] = self.versions.get(address, 0) + 1
+            self.entries.pop(address, None)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "addresses": len(self.entries)}
+
+
 class ElrondCrashDatabase:
-    """docstring for ElrondDatabase"""
+    """
+    Postgres storage backend. psycopg2 is only imported once a
+    connection pool is created.
+    """
 
     def __init__(self):
         self.db_name = DATABASE_PATH
         self.map = DATABASE_MAP
-        self.conn = self._connect()
-        self.cur = self.conn.cursor()
+        self.pool = self._connect()
 
     def _connect(self):
         """
-        Function connects to db and returns connection object
+        Function creates the connection pool to the db
 
         Returns:
-        psycopg2 connection obj
+        ConnectionPool
+        """
+        return ConnectionPool(
+            host=DB_HOST,
+            port=DB_PORT,
+            database=self.db_name,
+            user=DB_USER,
+            password=DB_PASS,
+        )
+
+    @contextmanager
+    def connection(self, query="other"):
+        """
+        Checks out a pooled connection, timing the checkout and the work
+        done with it as one query
+
+        Params:
+        query (str): the label the latency is recorded under
+        """
+        with metrics.db_query.time(query=query):
+            with self.pool.connection() as conn:
+                yield conn
+
+    def pool_metrics(self):
+        return self.pool.metrics()
+
+    def ensure_indexes(self):
         """
+        Function creates the indexes the per-player queries rely on
+        """
+        import psycopg2
+
         try:
-            conn = psycopg2.connect(
-                host=DB_HOST,
-                port=DB_PORT,
-                database=self.db_name,
-                user=DB_USER,
-                password=DB_PASS,
+            self.execute(
+                f"CREATE INDEX IF NOT EXISTS {BETS_TABLE_NAME}_address_timestamp_idx "
+                f"ON {BETS_TABLE_NAME} (address, timestamp DESC);"
             )
-            return conn
-        except UserWarning:
-            pass
+        except psycopg2.Error:
+            logger.exception(f"Could not create the address index on '{BETS_TABLE_NAME}'")
 
     def create_table(self, table: str, cols: list, pkey=False):
         """
@@ -63,7 +299,7 @@ class ElrondCrashDatabase:
         sql = f"""CREATE TABLE IF NOT EXISTS {table}("""
 
         if pkey:
-            unique_str = "PRIMARY KEY"
+            unique_str = " PRIMARY KEY"
         else:
             unique_str = ""
 
@@ -75,24 +311,27 @@ class ElrondCrashDatabase:
             else:
                 sql += f"{elem['name']} {elem['dtype']},"
         print(sql)
-        self.cur.execute(sql)
-        res = self.conn.commit()
-        print(res)
+        with self.connection("create_table") as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql)
 
-    def execute(self, sql):
+    def execute(self, sql, params=None):
         """
         Execute SQL query in the 'elrond.db' Database
 
         Params:
         sql (str): The SQL query
+        params (tuple): The values bound to its %s placeholders
 
         Returns:
         list
         """
-        cur = self.conn.cursor()
-        cur.execute(sql)
-        self.conn.commit()
-        return cur.fetchall()
+        with self.connection("execute") as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql, params)
+                if cur.description is None:
+                    return []
+                return cur.fetchall()
 
     def add_row(self, table, data):
         """
@@ -107,10 +346,121 @@ class ElrondCrashDatabase:
         None
         """
         sql = f"""INSERT INTO {table} VALUES {str(data)};"""
-        self.cur.execute(sql)
-        self.conn.commit()
+        with self.connection("add_row") as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql)
         logger.info(f"Adding row to '{table}':\t{data}")
 
+    def add_rows(self, table, rows, page_size=1000):
+        """
+        Function adds many rows to a table with parameterized
+        multi-row INSERT statements, in a single transaction
+
+        Params:
+        table (str): the name of the table to append to
+        rows (list of tuple): the values of each row
+        page_size (int): the number of rows sent per statement
+
+        Returns:
+        None
+        """
+        if not rows:
+            return
+
+        import psycopg2.extras
+
+        with self.connection("add_rows") as conn:
+            with conn.cursor() as cur:
+                psycopg2.extras.execute_values(
+                    cur, f"INSERT INTO {table} VALUES %s", rows, page_size=page_size
+                )
+        logger.info(f"Adding {len(rows)} rows to '{table}'")
+
+    def save_round(
+            self, game_row, bet_rows, games_table=GAMES_TABLE_NAME, bets_table=BETS_TABLE_NAME, settlement_id=None
+    ):
+        """
+        Function writes a finished round, its game row and all of
+        its bet rows, in one transaction
+
+        Params:
+        game_row (tuple): the values of the games row
+        bet_rows (list of tuple): the values of each bets row
+        games_table (str): the name of the games table
+        bets_table (str): the name of the bets table
+        settlement_id (int): the settlement marked settled in the
+            same transaction, if any
+
+        Returns:
+        None
+        """
+        import psycopg2.extras
+
+        placeholders = ", ".join(["%s"] * len(game_row))
+        with self.connection("save_round") as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"INSERT INTO {games_table} VALUES ({placeholders})", game_row)
+                if bet_rows:
+                    psycopg2.extras.execute_values(
+                        cur, f"INSERT INTO {bets_table} VALUES %s", bet_rows, page_size=1000
+                    )
+                if settlement_id is not None:
+                    cur.execute(SETTLED_SQL, (settlement_id,))
+        logger.info(f"Saved round to '{games_table}' with {len(bet_rows)} rows in '{bets_table}'")
+
+    def ensure_settlements_table(self):
+        """
+        Function creates the settlements table if it is missing
+        """
+        self.create_table(SETTLEMENTS_TABLE_NAME, SETTLEMENT_COLUMNS, pkey=True)
+
+    def add_settlement(self, row):
+        """
+        Function saves a finished round waiting for its payout. Saving
+        the same settlement again does nothing, so a save that failed
+        after committing can be retried
+
+        Params:
+        row (tuple): the values of the settlements row
+
+        Returns:
+        None
+        """
+        placeholders = ", ".join(["%s"] * len(row))
+        self.execute(
+            f"INSERT INTO {SETTLEMENTS_TABLE_NAME} VALUES ({placeholders}) ON CONFLICT (id) DO NOTHING", row
+        )
+
+    def update_settlement(self, settlement_id, status, chunks, tx_hash, attempts):
+        """
+        Function records the progress of a settlement
+
+        Params:
+        settlement_id (int): the id of the settled game
+        status (str): pending, signed, sent, failed or settled
+        chunks (str): JSON list of the signed payout transactions and
+            their status
+        tx_hash (str): the first payout transaction
+        attempts (int): the number of times payouts were sent
+
+        Returns:
+        None
+        """
+        self.execute(
+            f"UPDATE {SETTLEMENTS_TABLE_NAME} SET status=%s, chunks=%s, tx_hash=%s, attempts=%s WHERE id=%s",
+            (status, chunks, tx_hash, attempts, settlement_id),
+        )
+
+    def pending_settlements(self):
+        """
+        Function returns the settlements that are not settled yet,
+        oldest first
+
+        Returns:
+        pandas DataFrame
+        """
+        return self.read_sql(f"SELECT * FROM {SETTLEMENTS_TABLE_NAME} WHERE status != 'settled' ORDER BY id")
+
     def remove_by(self, table, condition):
         """
         Function removes item/s from a table in 'elrond.db'
@@ -123,8 +473,9 @@ class ElrondCrashDatabase:
         Returns:
         None
         """
-        self.cur.execute(f"DELETE FROM {table} where {condition};")
-        self.conn.commit()
+        with self.connection("remove_by") as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"DELETE FROM {table} where {condition};")
 
     def get_by_condition(self, table, condition):
         """
@@ -139,9 +490,7 @@ class ElrondCrashDatabase:
         None
         """
         sql = f"""SELECT * FROM {table} where {condition};"""
-        self.cur.execute(sql)
-        self.conn.commit()
-        return self.cur.fetchall()
+        return self.execute(sql)
 
     def get_table(self, table, limit=-1):
         """
@@ -153,17 +502,25 @@ class ElrondCrashDatabase:
 
         """
         if limit > 0:
-            df = pd.read_sql_query(
-                f"SELECT * FROM {table} ORDER BY timestamp DESC LIMIT {limit}",
-                self.conn,
-            )
+            df = self.read_sql(f"SELECT * FROM {table} ORDER BY timestamp DESC LIMIT %s", (limit,))
         else:
-            df = pd.read_sql_query(
-                f"SELECT * FROM {table}",
-                self.conn,
-            )
+            df = self.read_sql(f"SELECT * FROM {table}")
         return df
 
+    def read_sql(self, sql, params=None):
+        """
+        Runs a parameterized SELECT and returns a pandas DataFrame
+
+        Params:
+        sql (str): The SQL query, using %s placeholders
+        params (tuple): The values bound to the placeholders
+
+        Returns:
+        pandas DataFrame
+        """
+        with self.connection("read_sql") as conn:
+            return pd.read_sql_query(sql, conn, params=params)
+
     def get_last_rows(self):
         dic = {}
         for table in self.map.keys():
@@ -196,116 +553,233 @@ class ElrondCrashDatabase:
         print(sql)
         self.execute(sql)
 
+def open_storage(backend=STORAGE_BACKEND):
+    """
+    Returns the storage backend GameHistory reads and writes through:
+    "postgres" (ElrondCrashDatabase) or "sqlite" (SQLiteDatabase, a file
+    or in-memory database that needs no server)
+    """
+    if backend == "postgres":
+        return ElrondCrashDatabase()
+    if backend == "sqlite":
+        from sqlite_storage import SQLiteDatabase
+
+        return SQLiteDatabase()
+    raise ValueError(f"Unknown storage backend '{backend}'")
+
+
 class GameHistory:
-    """docstring for Elrond Crash Database"""
+    """
+    Long-lived view over the crash game history.
+
+    Only a bounded window of the most recent games, bets and users is
+    kept in memory. Saved rounds are appended to the window instead of
+    reloading the tables, and queries reaching past the window are
+    answered by the database.
+    """
 
     def __init__(self):
         self.map = DATABASE_MAP
         self.history_path = DATABASE_PATH
-        self.db = ElrondCrashDatabase()
+        self.db = open_storage()
+        self.executor = QueryExecutor()
+        self.player_cache = PlayerCache()
+        self.db.ensure_indexes()
+        self.db.ensure_settlements_table()
         self.game_history = self._import_game_history()
         self.bet_history = self._import_bet_history()
-        self.user_table = self._import_user_history()
+        user_table = self._import_user_history()
+        self.bets_window_complete = self.bet_history.shape[0] < BETS_HISTORY_WINDOW
+        self.users_window_complete = user_table.shape[0] < USERS_HISTORY_WINDOW
+        self.players = self._build_player_index(user_table)
+        self.leaderboard = self._import_leaderboard()
         self.last_ten_multipliers = self.get_last_multipliers()
+        self.last_game_bets = None
+        self.last_game_bets_hits = 0
+        self.last_game_bets_misses = 0
+        self.unsettled = self._import_unsettled()
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Runs a blocking history query in the query executor, e.g.
+        await history.run(history.get_user_last_bets, address)
+        """
+        return await self.executor.run(func, *args, **kwargs)
 
     def _import_game_history(self):
-        df = self.db.get_table(GAMES_TABLE_NAME)
-        return df
+        df = self.db.get_table(GAMES_TABLE_NAME, limit=GAMES_HISTORY_WINDOW)
+        return _oldest_first(df)
 
     def _import_bet_history(self):
-        df = self.db.get_table(BETS_TABLE_NAME)
-        return df
+        df = self.db.get_table(BETS_TABLE_NAME, limit=BETS_HISTORY_WINDOW)
+        return _oldest_first(df)
 
     def _import_user_history(self):
-        df = self.db.get_table(USERS_TABLE_NAME)
-        return df
+        df = self.db.get_table(USERS_TABLE_NAME, limit=USERS_HISTORY_WINDOW)
+        return _oldest_first(df)
 
-    def get_weekly_leaderboard(self):
-        sql_query = "select * from bets where timestamp >= current_date - 7 and timestamp <= current_date"
-        df = pd.read_sql_query(
-            sql_query,
-            self.db.conn,
+    def _build_player_index(self, user_table):
+        players = PlayerIndex()
+        players.load_users(user_table.to_dict("records"))
+        self._index_bet_history(players)
+        return players
+
+    def _index_bet_history(self, players):
+        df = self.bet_history
+        players.reindex(zip(df["timestamp"], df["address"], df["profit"]))
+
+    def _import_unsettled(self):
+        """
+        Loads the rounds whose settlement did not finish and appends them
+        to the in-memory windows, so the next game id and hash follow on
+        from them
+        """
+        from settlement import Settlement
+
+        settlements = [Settlement.from_row(row) for row in self.db.pending_settlements().to_dict("records")]
+        for settlement in settlements:
+            self.append_game(settlement.game_row)
+            self.append_bets(settlement.bet_rows)
+        return settlements
+
+    def _import_leaderboard(self):
+        leaderboard = WeeklyLeaderboard()
+        df = self.db.read_sql(
+            f"SELECT date(timestamp) AS day, address, sum(amount) AS volume, sum(profit) AS profit "
+            f"FROM {BETS_TABLE_NAME} WHERE timestamp >= %s GROUP BY 1, 2",
+            (date.today() - timedelta(days=leaderboard.days),),
         )
-        unique_bettors = df["address"].unique()
-        final = []
+        leaderboard.load(df[["day", "address", "volume", "profit"]].itertuples(index=False, name=None))
+        return leaderboard
+
+    def append_game(self, row: tuple):
+        """
+        Appends a saved game row to the in-memory window
+
+        Params:
+        row (tuple): the row as written to the games table
+        """
+        new_history = _append_rows(self.game_history, [row], GAMES_HISTORY_WINDOW)
+        setattr(self, "game_history", new_history)
+        setattr(self, "last_ten_multipliers", self.get_last_multipliers())
 
-        for addr in unique_bettors:
-            volume = df[df["address"] == addr]["amount"].sum()
-            profit = df[df["address"] == addr]["profit"].sum()
-            final.append(
-                {"address": addr, "volume": float("{:.2f}".format(volume)), "profit": float("{:.2f}".format(profit))})
+    def append_bets(self, rows: list):
+        """
+        Appends a round's saved bet rows to the in-memory window
+
+        Params:
+        rows (list of tuple): the rows as written to the bets table
+        """
+        if not rows:
+            return
 
-        final = pd.DataFrame(final)
-        final = final.sort_values(by=["volume"], ascending=[False])
-        final_list = []
+        self.leaderboard.add_bets(rows)
+        new_history = _append_rows(self.bet_history, rows, BETS_HISTORY_WINDOW)
+        if new_history.shape[0] < self.bet_history.shape[0] + len(rows):
+            setattr(self, "bets_window_complete", False)
+        setattr(self, "bet_history", new_history)
+
+        if self.players.bet_count + len(rows) > 2 * BETS_HISTORY_WINDOW:
+            self._index_bet_history(self.players)
+        else:
+            self.players.add_bets((row[0], row[2], row[6]) for row in rows)
+
+    def round_saved(self, game_id, tx_hash, bet_rows):
+        """
+        Called once a settled round is in the database: records its
+        payout transaction in the in-memory window and drops its players'
+        cached query results, which were read before the rows were there
+        """
+        rows = self.game_history["id"] == game_id
+        self.game_history.loc[rows, "tx_hash"] = tx_hash
+        self.player_cache.invalidate({row[2] for row in bet_rows})
 
-        for i, elem in final.iterrows():
-            final_list.append(elem.to_json())
+    def _bets_window_covers(self, from_ts):
+        if self.bets_window_complete:
+            return True
+        if self.bet_history.empty:
+            return False
+        return pd.Timestamp(from_ts) >= self.bet_history["timestamp"].iloc[0]
+
+    def _get_user(self, address):
+        user = self.players.get_user(address)
+        if user is None and not self.users_window_complete:
+            user_df = self.db.read_sql(
+                f"SELECT * FROM {USERS_TABLE_NAME} WHERE address=%s LIMIT 1",
+                (address,),
+            )
+            if not user_df.empty:
+                user = user_df.to_dict("records")[0]
+                self.players.set_user(user)
+        return user
 
-        return final_list
+    def get_weekly_leaderboard(self):
+        return self.leaderboard.get()
 
     def get_user_profile(self, address, interval=1):
         from_ts = datetime.now() - timedelta(days=interval)
         from_ts = from_ts.date()
-        user_df = self.user_table[self.user_table["address"] == address]
-        user_bets = self.bet_history.loc[
-            (self.bet_history["address"] == address) & (self.bet_history["timestamp"] > from_ts)
-            ]
+        user = self._get_user(address)
 
-        if user_bets.empty:
+        if self._bets_window_covers(from_ts):
+            top_win, tot_games = self.players.stats_since(address, from_ts)
+        else:
+            stats = self.db.read_sql(
+                f"SELECT max(profit) AS top_win, count(*) AS total_games FROM {BETS_TABLE_NAME} "
+                "WHERE address=%s AND timestamp > %s",
+                (address, from_ts),
+            )
+            top_win = stats["top_win"].iloc[0]
+            tot_games = int(stats["total_games"].iloc[0])
+
+        if tot_games == 0:
             final = {"address": address, "top_win": 0, "total_games": 0}
         else:
-            top_win = user_bets["profit"].max()
-            tot_games = user_bets.shape[0]
             final = {"address": address, "top_win": top_win, "total_games": tot_games}
 
-        if user_df.empty:
+        if user is None:
             return final
         else:
-            user_data = user_df[
-                [
-                    "discord_name",
-                    "discord_id",
-                    "avatar_hash",
-                    "exp",
-                    "raffle_tickets",
-                    "title",
-                ]
-            ].iloc[0]
-            user_data["discord_id"] = user_data["discord_id"].astype(str)
-            user_data = user_data.to_dict()
-            print(user_data)
+            user_data = {col: user.get(col) for col in USER_PROFILE_COLS}
+            user_data["discord_id"] = str(user_data["discord_id"])
             final.update(user_data)
 
         final.update({"interval_in_days": interval})
         return final
 
     def get_player_weekly_stats(self, addr: str) -> dict:
-        sql_query = f"select * from bets where address='{addr}' and timestamp >= date_trunc('week', current_date) - interval '1 week'"
-        df = pd.read_sql_query(
-            sql_query,
-            self.db.conn,
+        today = date.today()
+        week_start = today - timedelta(days=today.weekday() + 7)
+        return self.player_cache.get_or_load(
+            addr, ("weekly_stats", week_start), lambda: self._query_player_weekly_stats(addr, week_start)
         )
-        final = {"volume": df["amount"].sum(), "profit": df["profit"].sum(), "games_played": df.shape[0]}
-        return final
 
-    def get_user_last_bets(self, addr: str):
-        sql_query = f"select * from bets where address='{addr}'"
-        df = pd.read_sql_query(
-            sql_query,
-            self.db.conn,
+    def _query_player_weekly_stats(self, addr: str, week_start: date) -> dict:
+        sql_query = (
+            f"select coalesce(sum(amount), 0) as volume, coalesce(sum(profit), 0) as profit, "
+            f"count(*) as games_played from {BETS_TABLE_NAME} "
+            "where address=%s and timestamp >= %s"
         )
-        final = []
-        df = df.iloc[-10:]
-        if df.empty:
-            return final
-        cols = ["timestamp", "address", "amount", "profit"]
-        for i, row in df.iterrows():
-            final.append(row[cols].to_dict())
+        row = self.db.read_sql(sql_query, (addr, week_start)).iloc[0]
+        final = {
+            "volume": float(row["volume"]),
+            "profit": float(row["profit"]),
+            "games_played": int(row["games_played"]),
+        }
+        return final
 
-        final.reverse()
+    def get_user_last_bets(self, addr: str, limit=10):
+        return self.player_cache.get_or_load(
+            addr, ("last_bets", limit), lambda: self._query_user_last_bets(addr, limit)
+        )
 
-        return final
+    def _query_user_last_bets(self, addr: str, limit=10):
+        sql_query = (
+            f"select timestamp, address, amount, profit from {BETS_TABLE_NAME} "
+            "where address=%s order by timestamp desc limit %s"
+        )
+        df = self.db.read_sql(sql_query, (addr, limit))
+        return df.to_dict("records")
 
     def get_last_multipliers(self):
         if hasattr(self, "game_history") and not self.game_history.empty:
@@ -334,6 +808,29 @@ class GameHistory:
             return []
 
     def get_last_game_bets(self):
+        """
+        Returns the bets of the last finished round. The list is computed
+        once per round and served from memory until the next save.
+        """
+        if self.last_game_bets is not None:
+            self.last_game_bets_hits += 1
+            return self.last_game_bets
+
+        self.last_game_bets_misses += 1
+        setattr(self, "last_game_bets", self._compute_last_game_bets())
+        return self.last_game_bets
+
+    def set_last_game_bets(self, bets: list):
+        setattr(self, "last_game_bets", bets)
+
+    def get_last_game_bets_stats(self):
+        return {
+            "hits": self.last_game_bets_hits,
+            "misses": self.last_game_bets_misses,
+            "cached": self.last_game_bets is not None,
+        }
+
+    def _compute_last_game_bets(self):
         if self.bet_history.empty:
             bets = []
             return bets
@@ -359,7 +856,6 @@ class GameHistory:
         return parsed_bets
 
     def new_user(self, user: dict):
-        users_table = self.user_table
         assert "address" in user.keys()
         user_schema = {
             "id": 1,
@@ -375,16 +871,18 @@ class GameHistory:
             "title": "",
         }
 
-        usr_df = users_table[users_table["address"] == user["address"]]
+        old_user = self._get_user(user["address"])
         for col in user.keys():
             if col in user_schema.keys():
                 user_schema.update({col: user[col]})
 
-        if usr_df.empty:
+        if old_user is None:
             self.db.add_row("users_dev", tuple(user_schema.values()))
         else:
             self.db.update_user(user_schema)
 
+        self.players.set_user(user_schema)
+
     def add_new_game(self, game):
         last_game_id = self.game_history.loc[-1].id
         timestamp = datetime.now()
@@ -401,3 +899,19 @@ class GameHistory:
 
     def _update_game_history(self, new_row):
         self.db.add_row("games", new_row)
+
+
+def _oldest_first(df):
+    return df.iloc[::-1].reset_index(drop=True)
+
+
+def _append_rows(df, rows, window):
+    new_rows = pd.DataFrame([dict(zip(df.columns, row)) for row in rows], columns=df.columns)
+    if "timestamp" in new_rows.columns:
+        new_rows["timestamp"] = pd.to_datetime(new_rows["timestamp"])
+
+    if df.empty:
+        final = new_rows
+    else:
+        final = pd.concat([df, new_rows], ignore_index=True)
+    return final.iloc[-window:].reset_index(drop=True)
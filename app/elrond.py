@@ -1,12 +1,21 @@
-import requests
-from fastapi.exceptions import HTTPException
-from erdpy.accounts import Account, Address
-from erdpy.proxy import ElrondProxy
-from erdpy.transactions import Transaction  # , BunchOfTransactions
-from erdpy import config
-from vars import CHAIN_ID, SC_ADDRESS, ELROND_GATEWAY, ELROND_API
+import httpx
+from gateway import gateway
+from metrics import chain_call, chain_errors, timed
+from vars import CHAIN_ID, SC_ADDRESS, ELROND_GATEWAY, ELROND_API, PAYOUT_CONFIRM_TIMEOUT
+from typing import TYPE_CHECKING
 import asyncio
 import logging
+import threading
+import time
+
+# gas per multiplyFunds entry; a transaction also pays for one more
+REWARD_GAS_PER_ENTRY = 6000000
+MAX_GAS_LIMIT = 600000000
+
+# erdpy takes longer to import than the rest of the app together, it is
+# loaded by the functions that use it
+if TYPE_CHECKING:
+    from erdpy.accounts import Account
 
 logger = logging.getLogger("fastapi")
 logger.setLevel(logging.DEBUG)
@@ -21,13 +30,35 @@ else:
 
 
 def get_proxy_and_account():
+    from erdpy.accounts import Account
+    from erdpy.proxy import ElrondProxy
+
     proxy = ElrondProxy(ELROND_GATEWAY)
     account = Account(pem_file="wallet.pem")
     account.sync_nonce(proxy)
     return proxy, account
 
 
-elrond_proxy, elrond_account = get_proxy_and_account()
+elrond_proxy = None
+elrond_account = None
+_connect_lock = threading.Lock()
+
+
+def connect():
+    """
+    Loads the house wallet and syncs its nonce. Runs in the startup
+    phase, so importing this module never touches the network. It
+    blocks on the PEM file and the gateway, so callers on the event loop
+    run it in an executor.
+
+    Returns:
+        (proxy, account)
+    """
+    global elrond_proxy, elrond_account
+    with _connect_lock:
+        if elrond_account is None:
+            elrond_proxy, elrond_account = get_proxy_and_account()
+    return elrond_proxy, elrond_account
 
 
 def int_to_hex(number: int) -> str:
@@ -37,17 +68,21 @@ def int_to_hex(number: int) -> str:
     return hex_nr
 
 
-def get_all_bets():
+@timed(chain_call, chain_errors, call="get_all_bets")
+async def get_all_bets():
+    from erdpy.accounts import Address
+
     sc = ELROND_GATEWAY + "/address/" + SC_ADDRESS + "/keys"
     bet_funds_hex = "bet_funds.mapped".encode().hex()
     next_bet_funds_hex = "next_bet_funds.mapped".encode().hex()
-    storage = requests.get(sc)
 
     try:
-        storage.raise_for_status()
-        storage = storage.json()["data"]["pairs"]
-    except HTTPException:
-        print("Bad request:\t", storage.content)
+        storage = await gateway.get_json(sc)
+        storage = storage["data"]["pairs"]
+    except httpx.HTTPError as e:
+        chain_errors.inc(call="get_all_bets")
+        logger.warning(f"Bad request reading bets:\t{e}")
+        return {}
 
     bet_funds = {
         Address(key.replace(bet_funds_hex, "")).bech32(): int(value, 16) / pow(10, 18)
@@ -57,10 +92,13 @@ def get_all_bets():
     return bet_funds
 
 
-def get_all_rewards():
+async def get_all_rewards():
+    from erdpy.accounts import Address
+
     sc = ELROND_GATEWAY + "/address/" + SC_ADDRESS + "/keys"
     reward_funds_hex = "reward_funds.mapped".encode().hex()
-    storage = requests.get(sc).json()["data"]["pairs"]
+    storage = await gateway.get_json(sc)
+    storage = storage["data"]["pairs"]
     reward_funds = {
         Address(key.replace(reward_funds_hex, "")).bech32(): int(value, 16) / pow(10, 18)
         for key, value in storage.items()
@@ -69,7 +107,16 @@ def get_all_rewards():
     print(reward_funds)
 
 
-def place_bet(sender: Account, amount):
+async def get_nonce(address: str) -> int:
+    endpoint = ELROND_GATEWAY + f"/address/{address}/nonce"
+    response = await gateway.get_json(endpoint)
+    return int(response["data"]["nonce"])
+
+
+def place_bet(sender: "Account", amount):
+    from erdpy import config
+    from erdpy.transactions import Transaction
+
     tx = Transaction()
     tx.nonce = sender.nonce
     tx.sender = sender.address.bech32()
@@ -81,13 +128,25 @@ def place_bet(sender: Account, amount):
     tx.gasLimit = 6000000
     tx.version = config.get_tx_version()
     tx.sign(sender)
-    sent_tx = tx.send_wait_result(elrond_proxy, timeout=60)
+    proxy, _ = connect()
+    sent_tx = tx.send_wait_result(proxy, timeout=60)
     print(sent_tx)
 
 
-def send_rewards(sender: Account, adds: dict):
+def rewards_transaction(sender: "Account", adds: dict, nonce: int) -> dict:
+    """
+    Builds and signs a multiplyFunds transaction paying adds, a mapping
+    of address to cashout multiplier, with the given nonce
+
+    Returns:
+        The signed transaction, as sent to the gateway
+    """
+    from erdpy import config
+    from erdpy.accounts import Address
+    from erdpy.transactions import Transaction
+
     tx = Transaction()
-    tx.nonce = sender.nonce
+    tx.nonce = nonce
     tx.sender = sender.address.bech32()
     tx.value = str(int(0.00 * pow(10, 18)))
     tx.receiver = SC_ADDRESS
@@ -98,18 +157,68 @@ def send_rewards(sender: Account, adds: dict):
         mult_str = int(f"{round(multiplier, 2):.2f}".replace(".", ""))
         mult_str = int_to_hex(mult_str)
         tx.data += "@" + Address(address).hex() + "@" + mult_str
-    tx.gasLimit = (len(adds.keys()) + 1) * 6000000
+    tx.gasLimit = (len(adds.keys()) + 1) * REWARD_GAS_PER_ENTRY
     tx.version = config.get_tx_version()
     tx.sign(sender)
-    sent_tx = tx.send(elrond_proxy)
-    logging.info(f"Endgame rewards transaction:\t{sent_tx}", extra=sent_tx)
-    return sent_tx
-
-
-async def confirm_transaction(txHash: str):
+    return tx.to_dictionary()
+
+
+@timed(chain_call, chain_errors, call="send_transaction")
+async def send_transaction(payload: dict) -> str:
+    """
+    Submits a signed transaction through the gateway
+
+    Returns:
+        The transaction hash
+
+    Raises:
+        httpx.HTTPError when the gateway rejects it or cannot be reached
+    """
+    response = await gateway.post_json(ELROND_GATEWAY + "/transaction/send", payload)
+    tx_hash = response["data"]["txHash"]
+    logger.info(f"Sent transaction with nonce {payload['nonce']}:\t{tx_hash}")
+    return tx_hash
+
+
+@timed(chain_call, chain_errors, call="find_transaction")
+async def find_transaction(sender: str, nonce: int):
+    """
+    Looks up the transaction sender sent with nonce among its latest ones
+
+    Returns:
+        Its hash, or None if the API does not list it
+    """
+    endpoint = ELROND_API + f"/accounts/{sender}/transactions?sender={sender}&size=100"
+    for tx in await gateway.get_json(endpoint):
+        if tx.get("nonce") == nonce:
+            return tx["txHash"]
+    return None
+
+
+@timed(chain_call, chain_errors, call="confirm_transaction")
+async def confirm_transaction(txHash: str, timeout: float = PAYOUT_CONFIRM_TIMEOUT):
+    """
+    Waits for a transaction to be executed, for at most timeout seconds
+
+    Returns:
+        True if it succeeded, False if it failed, None if it was not
+        executed, or not known to the API, before the deadline
+    """
     endpoint = ELROND_API + f"/transactions/{txHash}"
+    deadline = time.monotonic() + timeout
     while True:
-        response = requests.get(endpoint)
+        if time.monotonic() > deadline:
+            logger.warning(f"Endgame tx not confirmed within {timeout}s:\t{txHash}")
+            return None
+
+        try:
+            response = await gateway.get(endpoint)
+        except httpx.HTTPError as e:
+            chain_errors.inc(call="confirm_transaction")
+            logger.info(f"Bad request confirming endgame tx:\t{endpoint}\t{e}")
+            await asyncio.sleep(2)
+            continue
+
         if response.status_code == 200:
             response = response.json()
             status = response["status"]
@@ -119,8 +228,10 @@ async def confirm_transaction(txHash: str):
             elif status == "success":
                 return True
             else:
-                print(response.json())
+                print(response)
                 return False
 
         else:
-            logger.info(f"Bad request confirming endgame tx:\t{endpoint}", extra=response.json())
+            chain_errors.inc(call="confirm_transaction")
+            logger.info(f"Bad request confirming endgame tx:\t{endpoint}\t{response.status_code} {response.text}")
+            await asyncio.sleep(2)
@@ -0,0 +1,80 @@
+import asyncio
+import logging
+
+import httpx
+
+from vars import GATEWAY_TIMEOUT, GATEWAY_MAX_CONNECTIONS, GATEWAY_MAX_KEEPALIVE, GATEWAY_CONCURRENCY
+
+logger = logging.getLogger("fastapi")
+logger.setLevel(logging.DEBUG)
+
+
+class GatewayClient:
+    """
+    Shared async HTTP client for the MultiversX gateway and API.
+
+    Connections are kept alive and pooled across calls, every request
+    has a timeout, and a semaphore bounds how many requests are in
+    flight so a burst of chain reads cannot starve the game loop.
+    """
+
+    def __init__(
+            self,
+            timeout=GATEWAY_TIMEOUT,
+            max_connections=GATEWAY_MAX_CONNECTIONS,
+            max_keepalive=GATEWAY_MAX_KEEPALIVE,
+            concurrency=GATEWAY_CONCURRENCY,
+    ):
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.concurrency = concurrency
+        self.client = None
+        self.semaphore = None
+
+    def _get_client(self):
+        if self.client is None or self.client.is_closed:
+            limits = httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive,
+            )
+            setattr(self, "client", httpx.AsyncClient(limits=limits, timeout=self.timeout))
+            setattr(self, "semaphore", asyncio.Semaphore(self.concurrency))
+        return self.client
+
+    async def get(self, url: str) -> httpx.Response:
+        client = self._get_client()
+        async with self.semaphore:
+            return await client.get(url)
+
+    async def get_json(self, url: str) -> dict:
+        """
+        GET a url and decode the JSON body
+
+        Raises:
+        httpx.HTTPError on network errors and non 2xx responses
+        """
+        response = await self.get(url)
+        response.raise_for_status()
+        return response.json()
+
+    async def post_json(self, url: str, payload: dict) -> dict:
+        """
+        POST a JSON payload and decode the JSON body
+
+        Raises:
+        httpx.HTTPError on network errors and non 2xx responses
+        """
+        client = self._get_client()
+        async with self.semaphore:
+            response = await client.post(url, json=payload)
+        response.raise_for_status()
+        return response.json()
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            setattr(self, "client", None)
+
+
+gateway = GatewayClient()
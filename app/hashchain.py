@@ -0,0 +1,132 @@
+"""
+Precomputed provably-fair hash chain.
+
+Each game hash is HMAC-SHA256(key=previous hash, msg=previous hash),
+starting from SALT_HASH, and its crash point follows from the hash. The
+chain is generated once, offline, into a memory-mappable .npy file where
+row i holds the 32 digest bytes and crash multiplier of chain index i.
+Round setup then becomes an array lookup.
+
+    python -m hashchain --length 10000000 --out hashchain.npy
+"""
+import argparse
+import hashlib
+import hmac
+import logging
+import os
+import time
+
+import numpy as np
+
+from vars import SALT_HASH, HASH_CHAIN_PATH, MAX_CRASH_MULTIPLIER
+
+logger = logging.getLogger("fastapi")
+logger.setLevel(logging.DEBUG)
+
+CHAIN_DTYPE = np.dtype([("hash", np.uint8, (32,)), ("multiplier", np.float64)])
+# rows compared per pass when looking a hash up in the file
+SCAN_ROWS = 1000000
+
+
+def get_result(game_hash: str):
+    """
+    Returns the hash following game_hash in the chain and its crash
+    multiplier
+    """
+    hm = hmac.new(str.encode(game_hash), b"", hashlib.sha256)
+    hm.update(game_hash.encode("utf-8"))
+    gme_hex = hm.hexdigest()
+
+    if int(gme_hex, 16) % 33 == 0:
+        return gme_hex, 1
+
+    h = int(gme_hex[:13], 16)
+    e = 2 ** 52
+    result = (((100 * e - h) / (e - h)) // 1) / 100.0
+    return gme_hex, result
+
+
+def generate(path, length, seed=SALT_HASH, chunk_size=100000):
+    """
+    Writes the first length entries of the chain seeded by seed to path
+    """
+    chain = np.lib.format.open_memmap(path, mode="w+", dtype=CHAIN_DTYPE, shape=(length,))
+    chunk = np.zeros(min(chunk_size, length), dtype=CHAIN_DTYPE)
+    game_hash = seed
+    start = time.perf_counter()
+
+    for offset in range(0, length, chunk_size):
+        size = min(chunk_size, length - offset)
+        for i in range(size):
+            game_hash, multiplier = get_result(game_hash)
+            chunk["hash"][i] = np.frombuffer(bytes.fromhex(game_hash), dtype=np.uint8)
+            chunk["multiplier"][i] = multiplier
+        chain[offset: offset + size] = chunk[:size]
+
+    chain.flush()
+    logger.info(f"Generated {length} chain entries in {time.perf_counter() - start:.1f}s")
+    return path
+
+
+class HashChain:
+    """docstring for HashChain"""
+
+    def __init__(self, path):
+        self.path = path
+        self.chain = np.load(path, mmap_mode="r")
+
+    @classmethod
+    def open(cls, path=HASH_CHAIN_PATH):
+        if not path or not os.path.exists(path):
+            logger.info("No precomputed hash chain found, hashes will be derived per round")
+            return None
+        return cls(path)
+
+    def __len__(self):
+        return self.chain.shape[0]
+
+    def hash_at(self, position):
+        return self.chain["hash"][position].tobytes().hex()
+
+    def position_of(self, game_hash, scan_rows=SCAN_ROWS):
+        """
+        Returns the chain index of game_hash, or None if it is not in the
+        file. This scans the file scan_rows at a time, stopping at the
+        first match, and is meant to run once at startup, off the event
+        loop.
+        """
+        target = np.void(bytes.fromhex(game_hash))
+        for start in range(0, len(self), scan_rows):
+            # each hash as one 32 byte value, compared without an N x 32 array
+            hashes = np.ascontiguousarray(self.chain["hash"][start:start + scan_rows]).view(target.dtype)
+            matches = np.flatnonzero(hashes[:, 0] == target)
+            if matches.size:
+                return start + int(matches[0])
+        return None
+
+    def next_after(self, position, max_multiplier=MAX_CRASH_MULTIPLIER):
+        """
+        Returns (position, hash, multiplier) of the first round after
+        position whose crash point is playable, or None past the end of
+        the file
+        """
+        position += 1
+        while position < len(self):
+            multiplier = float(self.chain["multiplier"][position])
+            if multiplier <= max_multiplier:
+                return position, self.hash_at(position), multiplier
+            position += 1
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--length", type=int, required=True)
+    parser.add_argument("--out", default=HASH_CHAIN_PATH)
+    parser.add_argument("--seed", default=SALT_HASH, help="defaults to the HASH environment variable")
+    args = parser.parse_args()
+    generate(args.out, args.length, seed=args.seed)
+
+
+if __name__ == "__main__":
+    main()
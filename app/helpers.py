@@ -1,21 +1,15 @@
-from time import sleep
-from json import loads
-from vars import DELAY
-from cloudscraper import create_scraper
+from gateway import gateway
 
-scraper = create_scraper()
 
-
-def get_http_request(url):
-    req = scraper.get(url)
-    sleep(DELAY)
+async def get_http_request(url):
+    req = await gateway.get(url)
     return req
 
 
-def check_player_balance(address, balance):
+async def check_player_balance(address, balance):
     req_url = f"https://api.elrond.com/accounts/{address}"
-    req = get_http_request(req_url)
-    req = loads(req)
+    req = await get_http_request(req_url)
+    req = req.json()
     if "balance" in req.keys():
         balance_now = float(req["balance"])
         actual_balance = balance_now / (10 ** 18)
@@ -0,0 +1,106 @@
+import json
+import logging
+from datetime import date, datetime, timedelta
+
+logger = logging.getLogger("fastapi")
+logger.setLevel(logging.DEBUG)
+
+
+class WeeklyLeaderboard:
+    """
+    Rolling per-address volume and profit over the last days.
+
+    Totals are kept per day bucket and per address. Saved rounds are
+    added once, whole buckets expire when the day rolls over, and the
+    sorted leaderboard is rebuilt only when something changed, so reads
+    are served from a ready snapshot.
+    """
+
+    def __init__(self, days=7):
+        self.days = days
+        self.buckets = {}
+        self.totals = {}
+        self.snapshot = []
+        self.stale = False
+
+    def load(self, rows):
+        """
+        Seeds the buckets from the database aggregate
+
+        Params:
+        rows (iterable): (day, address, volume, profit) tuples
+        """
+        for day, address, volume, profit in rows:
+            self._add(_to_date(day), address, float(volume), float(profit))
+        self._rebuild()
+
+    def add_bets(self, rows):
+        """
+        Adds a saved round to the buckets
+
+        Params:
+        rows (list of tuple): bet rows as written to the bets table
+        """
+        for timestamp, _, address, amount, _, _, profit, _ in rows:
+            self._add(_to_date(timestamp), address, float(amount), float(profit))
+        setattr(self, "stale", True)
+
+    def get(self, today=None):
+        self.expire(today or date.today())
+        if self.stale:
+            self._rebuild()
+        return self.snapshot
+
+    def expire(self, today):
+        first_day = today - timedelta(days=self.days)
+        old_days = [day for day in self.buckets if day < first_day]
+        if not old_days:
+            return
+
+        for day in old_days:
+            del self.buckets[day]
+
+        totals = {}
+        for bucket in self.buckets.values():
+            for address, (volume, profit) in bucket.items():
+                total = totals.setdefault(address, [0.0, 0.0])
+                total[0] += volume
+                total[1] += profit
+
+        setattr(self, "totals", totals)
+        setattr(self, "stale", True)
+        logger.debug(f"Leaderboard expired {len(old_days)} day bucket(s)")
+
+    def _add(self, day, address, volume, profit):
+        bucket = self.buckets.setdefault(day, {})
+        entry = bucket.setdefault(address, [0.0, 0.0])
+        entry[0] += volume
+        entry[1] += profit
+
+        total = self.totals.setdefault(address, [0.0, 0.0])
+        total[0] += volume
+        total[1] += profit
+
+    def _rebuild(self):
+        ranked = sorted(self.totals.items(), key=lambda item: item[1][0], reverse=True)
+        snapshot = [
+            json.dumps(
+                {
+                    "address": address,
+                    "volume": float("{:.2f}".format(volume)),
+                    "profit": float("{:.2f}".format(profit)),
+                },
+                separators=(",", ":"),
+            )
+            for address, (volume, profit) in ranked
+        ]
+        setattr(self, "snapshot", snapshot)
+        setattr(self, "stale", False)
+
+
+def _to_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.fromisoformat(str(value)).date()
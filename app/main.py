@@ -1,29 +1,31 @@
 import asyncio
 import json
+import sys
 import traceback
-from datetime import datetime
 from typing import Dict, List
 import logging
 
-import erdpy.errors
 import nest_asyncio
-import psycopg2
 import websockets.exceptions
-from fastapi import FastAPI, WebSocket, HTTPException
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
-from elrond import get_all_bets
+from fastapi.responses import HTMLResponse, PlainTextResponse
+from broadcast import hub
+from gateway import gateway
 from helpers import check_player_balance
-from objects import Game
+from readiness import readiness
+from scheduler import RoundScheduler
+import metrics
 from schemas import BetSchema, CashoutAddress
-from vars import BETTING_DELAY
-from erdpy.accounts import Address
+from vars import VERIFY_MAX_GAMES, STARTUP_RETRY_DELAY
+import elrond
 
 nest_asyncio.apply()
 
 app = FastAPI()
 
-game = Game()
+# built in the startup phase, see bootstrap()
+game = None
 
 app.add_middleware(
     CORSMiddleware,
@@ -38,88 +40,144 @@ logger.setLevel(logging.DEBUG)
 
 
 async def run_game():
-    global game
+    """
+    Runs the round scheduler and restarts it when it fails. Meanwhile
+    /ready reports the engine as not ready.
+    """
     while True:
-        if hasattr(game, "isPaused") and game.isPaused:
-            await asyncio.sleep(1)
-            continue
+        try:
+            await RoundScheduler(game).run()
+        except Exception as e:
+            logger.exception(f"Game loop failed, restarting it:\t{traceback.format_exc()}")
+            readiness.fail("engine", e)
+            await asyncio.sleep(STARTUP_RETRY_DELAY)
+            readiness.mark("engine")
 
-        if game.state == "bet":
-            if game.afterCrash == "notCrash":
-                setattr(game, "afterCrash", "crash")
 
-            new_bets = get_all_bets()
+def current_game():
+    """
+    Returns the running Game, or answers 503 while it is still being
+    brought up by the startup phase
+    """
+    if game is None:
+        raise HTTPException(status_code=503, detail="Game is starting")
+    return game
 
-            if datetime.now() > game.start_time:
-                game.bets.update(new_bets)
-                game.toggle_state()
-            else:
-                if new_bets and not game.has_players:
-                    setattr(game, "has_players", True)
 
-                game.bets.update(new_bets)
-                await asyncio.sleep(BETTING_DELAY)
+def parse_address(address):
+    """
+    Returns the erdpy Address, or answers 422 for a malformed one. erdpy
+    is the slowest import of the app, so it is loaded on first use.
+    """
+    import erdpy.errors
+    from erdpy.accounts import Address
 
-        if game.state == "play":
-            game.iterate_game()
-            await asyncio.sleep(game.delay)
+    try:
+        return Address(address)
+    except (erdpy.errors.BadAddressFormatError, erdpy.errors.EmptyAddressError):
+        raise HTTPException(status_code=422, detail="Bad Address Format")
 
-            if game.runtime_index == -1:
-                await game.end_game()
 
+def load_game():
+    """
+    Imports the engine (pandas, NumPy, the database driver), loads the
+    game history and builds the Game on it, which scans the hash chain
+    file for the last round. Runs in a worker thread, off the event loop.
+    """
+    from database import GameHistory
+    from objects import Game
 
-@app.on_event("startup")
-async def start_game():
+    return Game(GameHistory())
+
+
+async def retry(name, func):
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            return await loop.run_in_executor(None, func)
+        except Exception as e:
+            readiness.fail(name, e)
+            await asyncio.sleep(STARTUP_RETRY_DELAY)
+
+
+async def bootstrap():
+    """
+    Startup phase. The database and the house wallet are brought up
+    concurrently and the game loop starts as soon as the history is
+    loaded; requests are served meanwhile and /ready answers 503.
+    """
+    global game
+    wallet = asyncio.create_task(retry("chain", elrond.connect))
+    game = await retry("db", load_game)
+    readiness.mark("db")
+
+    hub.set_snapshot_provider(game.to_frame)
+    hub.emit("state", **game.state_fields())
+    asyncio.create_task(game.settlements.run())
+    asyncio.create_task(run_game())
+    readiness.mark("engine")
+    logger.info("Game has been lauched successfully!")
+
+    await wallet
     try:
-        asyncio.create_task(run_game())
-        logger.info("Game has been lauched successfully!")
+        await game.sync_house_balance()
     except Exception:
         logger.exception(traceback.format_exc())
-        asyncio.create_task(run_game())
-        logger.warning("Game has been restarted!")
+    readiness.mark("chain")
+
+
+@app.on_event("startup")
+async def start_game():
+    asyncio.create_task(bootstrap())
+
+
+async def receive_resync(websoc: WebSocket, queue):
+    """
+    Listens for client messages on the socket. A "resync" message
+    replaces the pending deltas with a fresh snapshot.
+    """
+    try:
+        while True:
+            message = await websoc.receive_text()
+            if "resync" in message:
+                hub.resync(queue)
+    except (WebSocketDisconnect, websockets.exceptions.ConnectionClosed):
+        pass
+    finally:
+        hub.unsubscribe(queue)
+
+
+@app.on_event("shutdown")
+async def stop_game():
+    await gateway.close()
+    if "verify" in sys.modules:
+        sys.modules["verify"].verifications.shutdown()
+    if game is not None:
+        game.data.executor.shutdown()
+        game.data.db.pool.close()
 
 
 @app.websocket("/ws")
 async def ws(websoc: WebSocket):
+    await websoc.accept()
+    queue = hub.subscribe()
+    receiver = asyncio.create_task(receive_resync(websoc, queue))
     try:
-        global game
-        await websoc.accept()
         while True:
-            if hasattr(game, "isPaused") and game.isPaused:
-                await asyncio.sleep(1)
-                payload = {
-                    "gameState": "paused",
-                    "multiplier": -2,
-                    "activeBets": [],
-                    "lastBets": game.data.get_last_game_bets(),
-                    "betTimer": "",
-                }
-                payload = json.dumps(payload)
-                await websoc.send_json(payload)
-                continue
-
-            if game.state == "bet":
-                await asyncio.sleep(0.05)
-            elif game.state == "play":
-                await asyncio.sleep(0.02)
-            else:
-                await asyncio.sleep(0.5)
-
-            payload = {
-                "gameState": game.state,
-                "multiplier": "{:.2f}".format(game.multiplier_now),
-                "activeBets": game.get_current_bets(),
-                "lastBets": game.data.get_last_game_bets(),
-                "betTimer": game.get_countdown_as_str(),
-                "afterCrash": game.afterCrash,
-            }
-            await websoc.send_json(payload)
+            frame = await queue.get()
+            if frame is None:
+                break
+            await websoc.send_text(frame)
     except (websockets.exceptions.ConnectionClosedOK, websockets.exceptions.ConnectionClosed):
         print("connection closed OK")
     except websockets.exceptions.ConnectionClosedError:
         print("Connection closed error")
+    except WebSocketDisconnect:
+        print("connection closed OK")
     finally:
-        await websoc.close()
+        receiver.cancel()
+        hub.unsubscribe(queue)
+
 
 @app.get(
     "/currentBets",
@@ -130,7 +188,7 @@ async def get_current_bets() -> List[BetSchema]:
     """
     Get current bets from the SC
     """
-    global game
+    game = current_game()
     bets = game.get_current_bets()
 
     return bets
@@ -145,12 +203,9 @@ async def get_user_profile(walletAddress: str, interval: int = 1) -> Dict:
     """
     Get current bets from the SC
     """
-    try:
-        address = Address(walletAddress)
-        global game
-        user_profile = game.data.get_user_profile(address.bech32(), interval=interval)
-    except (erdpy.errors.BadAddressFormatError, erdpy.errors.EmptyAddressError):
-        raise HTTPException(status_code=422, detail="Bad Address Format")
+    address = parse_address(walletAddress)
+    game = current_game()
+    user_profile = await game.data.run(game.data.get_user_profile, address.bech32(), interval=interval)
 
     return user_profile
 
@@ -161,7 +216,7 @@ async def get_user_profile(walletAddress: str, interval: int = 1) -> Dict:
     response_model=List[Dict],
 )
 async def get_last_bets() -> List[Dict]:
-    global game
+    game = current_game()
     bets = game.data.get_last_game_bets()
     payload = {
         "bets": bets,
@@ -170,13 +225,31 @@ async def get_last_bets() -> List[Dict]:
     return payload["bets"]
 
 
+@app.get("/lastBetsCacheStats", tags=["dev", "getters"])
+async def get_last_bets_cache_stats():
+    game = current_game()
+    return game.data.get_last_game_bets_stats()
+
+
+@app.get("/dbPoolStats", tags=["dev", "getters"])
+async def get_db_pool_stats():
+    game = current_game()
+    return game.data.db.pool_metrics()
+
+
+@app.get("/playerCacheStats", tags=["dev", "getters"])
+async def get_player_cache_stats():
+    game = current_game()
+    return game.data.player_cache.stats()
+
+
 @app.get(
     "/getLastTenMultipliers",
     tags=["getters", "history"],
     response_model=List,
 )
 async def get_last_ten_multipliers():
-    global game
+    game = current_game()
     multipliers = game.data.get_last_multipliers()
     return multipliers
 
@@ -187,7 +260,7 @@ async def get_last_ten_multipliers():
     response_model=List[Dict],
 )
 async def get_latest_games():
-    global game
+    game = current_game()
     latest_games = game.data.get_latest_games()
     return latest_games
 
@@ -198,12 +271,9 @@ async def get_latest_games():
     response_model=Dict,
 )
 async def get_player_stats(address: str):
-    global game
-    try:
-        address = Address(address)
-    except (erdpy.errors.BadAddressFormatError, erdpy.errors.EmptyAddressError):
-        raise HTTPException(status_code=422, detail="Bad Address Format")
-    latest_games = game.data.get_player_weekly_stats(address.bech32())
+    game = current_game()
+    address = parse_address(address)
+    latest_games = await game.data.run(game.data.get_player_weekly_stats, address.bech32())
     return latest_games
 
 
@@ -213,47 +283,88 @@ async def get_player_stats(address: str):
     response_model=List,
 )
 async def get_last_ten_bets(data):
-    global game
-    try:
-        address = Address(data.walletAddress)
-    except (erdpy.errors.BadAddressFormatError, erdpy.errors.EmptyAddressError):
-        raise HTTPException(status_code=422, detail="Bad Address Format")
+    game = current_game()
+    address = parse_address(data.walletAddress)
 
-    bets = game.data.get_user_last_bets(address.bech32())
+    bets = await game.data.run(game.data.get_user_last_bets, address.bech32())
     return bets
 
 
+@app.get("/verifyGames", tags=["getters", "history"], response_model=Dict)
+async def verify_games(fromId: int = None, toId: int = None, startHash: str = None, count: int = 1000) -> Dict:
+    """
+    Recomputes saved games from the hash chain, either an id range or
+    count games after startHash
+    """
+    from verify import verifications, VerificationBusy
+
+    game = current_game()
+    if startHash:
+        if not 0 < count <= VERIFY_MAX_GAMES:
+            raise HTTPException(status_code=422, detail=f"count must be between 1 and {VERIFY_MAX_GAMES}")
+        job = ("verify_from_hash", startHash, count)
+    else:
+        if fromId is None or toId is None:
+            raise HTTPException(status_code=422, detail="Give fromId and toId, or startHash")
+        if not 0 <= toId - fromId < VERIFY_MAX_GAMES:
+            raise HTTPException(status_code=422, detail=f"Verify at most {VERIFY_MAX_GAMES} games per request")
+        job = ("verify_range", fromId, toId)
+
+    try:
+        return await verifications.run(game.data.db, *job)
+    except VerificationBusy as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+
 @app.get("/checkPlayerBalance/{walletAddress}/{balance}/{signer}")
 async def check_balance(
         wallet_address: str,
         balance: float,
 ) -> bool:
-    try:
-        address = Address(data.walletAddress)
-    except (erdpy.errors.BadAddressFormatError, erdpy.errors.EmptyAddressError):
-        raise HTTPException(status_code=422, detail="Bad Address Format")
+    address = parse_address(data.walletAddress)
 
     # user = UserSchema(walletAddress=walletAddress, balance=balance, signer=signer)
-    payload = {"status": check_player_balance(address.bech32(), balance)}
+    payload = {"status": await check_player_balance(address.bech32(), balance)}
     return payload["status"]
 
 
+@app.get("/ready", tags=["dev", "getters"])
+async def ready(response: Response):
+    """
+    Readiness probe: 200 once the database, the chain wallet and the
+    game engine are warm, 503 with the pending components until then
+    """
+    if not readiness.is_ready():
+        response.status_code = 503
+    return readiness.to_dict()
+
+
+@app.get("/metrics", tags=["dev", "getters"], response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Engine, websocket, storage and chain metrics in the Prometheus text
+    format
+    """
+    return PlainTextResponse(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+
 @app.get("/getCurrentGameState", tags=["dev", "getters"])
 async def get_game_state():
-    global game
+    game = current_game()
     state = game.state
     return {"state": state}
 
 
 @app.get("/weeklyLeaderboard", tags=["getters"])
 async def weekly_leaderboard():
+    game = current_game()
     wlb = game.data.get_weekly_leaderboard()
     return wlb
 
 
 @app.post("/cashout", tags=["bets", "actions"])
 async def cashout(data: CashoutAddress):
-    global game
+    game = current_game()
     print(data)
     if game.state in ["bet", "end"]:
         raise HTTPException(
@@ -266,36 +377,24 @@ async def cashout(data: CashoutAddress):
 
 @app.post("/crashGame", tags=["actions"])
 async def end_game():
-    try:
-        if game.state != "play":
-            raise HTTPException(
-                status_code=403,
-                detail="Can only crash game during PLAY state",
-            )
-
-        else:
-            setattr(game, "runtime_index", -1)
-            await asyncio.sleep(2)
-            if game.state != "play":
-                return {"status": "success"}
-            else:
-                return {"status": "fail"}
-
-    except (psycopg2.InterfaceError, psycopg2.OperationalError) as e:
-        print("Connection ERROR! attempting to reconnect")
-        print(e)
-        game.data.db.__init__()
-        setattr(game, "runtime_index", -1)
-        await asyncio.sleep(2)
-        if game.state != "play":
-            return {"status": "success"}
-        else:
-            return {"status": "fail"}
+    game = current_game()
+    if game.state != "play":
+        raise HTTPException(
+            status_code=403,
+            detail="Can only crash game during PLAY state",
+        )
+
+    setattr(game, "runtime_index", -1)
+    await asyncio.sleep(2)
+    if game.state != "play":
+        return {"status": "success"}
+    else:
+        return {"status": "fail"}
 
 
 @app.post("/toggleGameState", tags=["dev", "actions"])
 async def toggle_state():
-    global game
+    game = current_game()
     old_state = game.state
     game.toggle_state()
     if game.state != old_state:
@@ -309,7 +408,7 @@ async def authenticate_discord(code: str, state: str):
     from discord_auth import exchange_code, get_user_data
     from vars import REDIRECT_HTML
 
-    global game
+    game = current_game()
     token = exchange_code(code)["access_token"]
     user_discord = get_user_data(token)
     user = {
@@ -319,18 +418,20 @@ async def authenticate_discord(code: str, state: str):
         "avatar_hash": user_discord["avatar"],
     }
 
-    game.data.new_user(user)
+    await game.data.run(game.data.new_user, user)
 
     return REDIRECT_HTML
 
 
 @app.post("/pauseGame", tags=["dev", "actions"])
 async def pause_game():
-    global game
+    game = current_game()
     setattr(game, "isPaused", True)
+    hub.emit("state", **game.state_fields())
 
 
 @app.post("/resumeGame", tags=["dev", "actions"])
 async def resume_game():
-    global game
+    game = current_game()
     setattr(game, "isPaused", False)
+    hub.emit("state", **game.state_fields())
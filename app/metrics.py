@@ -0,0 +1,263 @@
+"""
+In-process metrics, exposed in the Prometheus text format on /metrics.
+
+Every thread records into its own shard of a metric, so recording takes
+no lock and costs a dict lookup and an addition: cheap enough to leave
+on in production. Shards are only merged when /metrics is scraped.
+"""
+import functools
+import inspect
+import threading
+import time
+from bisect import bisect_left
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=(), registry=registry):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards = []
+        registry.register(self)
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            self._shards.append(shard)
+            return shard
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key, extra=""):
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def samples(self):
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        shard = self._shard()
+        key = self._key(labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    def values(self):
+        merged = {}
+        for shard in list(self._shards):
+            for key, value in list(shard.items()):
+                merged[key] = merged.get(key, 0) + value
+        return merged
+
+    def samples(self):
+        return [f"{self.name}{self._labels(key)} {_number(value)}" for key, value in sorted(self.values().items())]
+
+
+class Gauge(_Metric):
+    """
+    A single value, either set directly or read from a function at
+    scrape time
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, registry=registry):
+        super().__init__(name, documentation, registry=registry)
+        self.value = 0
+        self.function = None
+
+    def set(self, value):
+        setattr(self, "value", value)
+
+    def set_function(self, function):
+        setattr(self, "function", function)
+
+    def samples(self):
+        value = self.function() if self.function is not None else self.value
+        return [f"{self.name} {_number(value)}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, buckets, labelnames=(), registry=registry):
+        super().__init__(name, documentation, labelnames, registry)
+        self.bounds = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        """
+        Records one observation
+
+        Params:
+            - value: the observed value, in seconds for the timings here
+            - labels: a value for each of the labelnames
+        """
+        shard = self._shard()
+        key = self._key(labels)
+        row = shard.get(key)
+        if row is None:
+            # a count per bucket, the +Inf count, then the sum
+            row = shard[key] = [0] * (len(self.bounds) + 2)
+        row[bisect_left(self.bounds, value)] += 1
+        row[-1] += value
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def rows(self):
+        merged = {}
+        for shard in list(self._shards):
+            for key, row in list(shard.items()):
+                total = merged.setdefault(key, [0] * len(row))
+                for i, value in enumerate(row):
+                    total[i] += value
+        return merged
+
+    def samples(self):
+        lines = []
+        for key, row in sorted(self.rows().items()):
+            cumulative = 0
+            for bound, count in zip(self.bounds + (float("inf"),), row[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                bucket = self._labels(key, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{bucket} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(key)} {_number(row[-1])}")
+            lines.append(f"{self.name}_count{self._labels(key)} {cumulative}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+def timed(histogram, errors=None, **labels):
+    """
+    Decorator timing every call of a function or coroutine function into
+    histogram. Calls that raise are also counted in errors.
+    """
+
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                except Exception:
+                    if errors is not None:
+                        errors.inc(**labels)
+                    raise
+                finally:
+                    histogram.observe(time.perf_counter() - start, **labels)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                except Exception:
+                    if errors is not None:
+                        errors.inc(**labels)
+                    raise
+                finally:
+                    histogram.observe(time.perf_counter() - start, **labels)
+
+        return wrapper
+
+    return decorator
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+tick_interval = Histogram(
+    "crash_tick_interval_seconds",
+    "Time between consecutive game ticks",
+    [0.04, 0.045, 0.05, 0.055, 0.06, 0.075, 0.1, 0.15, 0.25, 0.5, 1],
+)
+tick_jitter = Histogram(
+    "crash_tick_jitter_seconds",
+    "How late a tick fired behind its point on the tick grid",
+    [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5],
+)
+tick_overruns = Counter("crash_tick_overruns_total", "Ticks that were already due when the previous one finished")
+ticks_skipped = Counter("crash_ticks_skipped_total", "Grid points skipped after falling a whole interval behind")
+iterate_duration = Histogram(
+    "crash_iterate_game_seconds",
+    "Duration of Game.iterate_game",
+    [0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01],
+)
+ws_fanout = Histogram(
+    "crash_ws_fanout_seconds",
+    "Time to queue one frame for every websocket subscriber",
+    [0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05],
+)
+ws_clients = Gauge("crash_ws_clients", "Connected websocket clients")
+ws_resyncs = Counter("crash_ws_resyncs_total", "Snapshots sent to subscribers that fell behind or asked for one")
+db_query = Histogram(
+    "crash_db_query_seconds",
+    "Storage query latency, including the wait for a pooled connection",
+    [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5],
+    labelnames=["query"],
+)
+chain_call = Histogram(
+    "crash_chain_call_seconds",
+    "Latency of calls to the chain gateway and API",
+    [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60],
+    labelnames=["call"],
+)
+settlement_duration = Histogram(
+    "crash_settlement_seconds",
+    "Time from the end of a round until its payout is confirmed and saved",
+    [1, 2.5, 5, 10, 15, 30, 60, 120, 300, 600],
+)
+settlements_unconfirmed = Gauge("crash_settlements_unconfirmed", "Finished rounds whose payout is not confirmed yet")
+chain_errors = Counter("crash_chain_call_errors_total", "Failed calls to the chain gateway and API", ["call"])
@@ -1,98 +1,283 @@
 import json
-import random
 import logging
 import traceback
 
-from app.helpers import get_http_request
+from helpers import get_http_request
+from broadcast import hub
+from curve import multiplier_at, CURVE_SEGMENTS
+from rules import REROLL_ABOVE, must_force_crash, reroll_multiplier
 from database import GameHistory
-from vars import STARTING_WALLET_AMT, SALT_HASH, BETTING_STAGE_DURATION, REWARDS_WALLET, ELROND_API
-from datetime import datetime, timedelta
-from elrond import send_rewards, get_proxy_and_account, confirm_transaction
-import hashlib
-import hmac
+from hashchain import HashChain, get_result
+from vars import (
+    STARTING_WALLET_AMT,
+    SALT_HASH,
+    BETTING_STAGE_DURATION,
+    REWARDS_WALLET,
+    ELROND_API,
+    TICK_INTERVAL,
+    MAX_CRASH_MULTIPLIER,
+)
+from datetime import datetime
+from settlement import Settlement, SettlementQueue
 import pandas as pd
 import numpy as np
 import asyncio
+import time
 
 logger = logging.getLogger("fastapi")
 logger.setLevel(logging.DEBUG)
 
 
-class Bets:
-    """docstring for Bet"""
+BET_COLUMNS = [
+    "timestamp",
+    "hash",
+    "address",
+    "amount",
+    "haswon",
+    "multiplier",
+    "profit",
+    "state",
+]
+
 
-    def __init__(self):
-        self.to_list = []
+class Bets:
+    """
+    Columnar bet book of a round, keyed by wallet address.
+
+    Amounts, open/won flags, cashout multipliers and profits live in
+    contiguous NumPy arrays so per-tick aggregates, forced cashouts and
+    end of round totals are vectorized. Addresses map to their row in
+    the arrays, which keeps insertion order for display and makes
+    merges, cashouts and lookups O(1).
+    """
+
+    def __init__(self, capacity=64):
+        self.size = 0
+        self.open_count = 0
+        self.index = {}
+        self.addresses = []
+        self.timestamps = []
+        self.amounts = np.zeros(capacity, dtype=np.float64)
+        self.is_open = np.zeros(capacity, dtype=bool)
+        self.haswon = np.zeros(capacity, dtype=bool)
+        self.cashout_mults = np.zeros(capacity, dtype=np.float64)
+        self.profits = np.zeros(capacity, dtype=np.float64)
+
+    def __iter__(self):
+        for i in range(self.size):
+            yield self._bet_at(i)
+
+    def __len__(self):
+        return self.size
+
+    def __reversed__(self):
+        for i in range(self.size - 1, -1, -1):
+            yield self._bet_at(i)
+
+    @property
+    def to_list(self):
+        return list(self)
+
+    def get(self, address):
+        i = self.index.get(address)
+        if i is None:
+            return None
+        return self._bet_at(i)
 
     def to_dict(self):
-        final = {}
-        for bet in self.to_list:
-            final.update({bet.address: bet.amount})
-        setattr(self, "to_dict", final)
-        return self.to_dict
+        return dict(zip(self.addresses, self.amounts[: self.size].tolist()))
 
     def update(self, new_bets: dict):
+        """
+        Applies a chain poll to the book. New addresses are added, changed
+        amounts are updated in place and cashout state is kept.
+
+        Returns:
+        list of the Bet objects that were added or changed
+        """
+        changed = []
         if not new_bets:
-            return
-
-        new_bets = [Bet(addr, amount) for addr, amount in new_bets.items()]
-        setattr(self, "to_list", new_bets)
+            return changed
+
+        for addr, amount in new_bets.items():
+            i = self.index.get(addr)
+            if i is None:
+                i = self._insert(addr, amount, datetime.now().isoformat())
+            elif self.amounts[i] != amount:
+                self.amounts[i] = amount
+            else:
+                continue
+            changed.append(self._bet_at(i))
+
+        return changed
+
+    def aggregates(self, mult_now):
+        """
+        Returns the total amount bet and what players would win if every
+        open bet cashed out at mult_now
+        """
+        n = self.size
+        amounts = self.amounts[:n]
+        total_bets = float(amounts.sum())
+        open_amount = float(np.dot(amounts, self.is_open[:n]))
+        won_profits = float(np.dot(self.profits[:n], self.haswon[:n]))
+        return total_bets, won_profits + open_amount * mult_now
+
+    def totals(self):
+        """
+        Returns the pool size and the sum of the winners' payouts
+        """
+        n = self.size
+        pool_size = float(self.amounts[:n].sum())
+        player_profits = float(np.dot(self.profits[:n], self.haswon[:n]))
+        return pool_size, player_profits
+
+    def payouts(self):
+        return dict(zip(self.addresses, self.cashout_mults[: self.size].tolist()))
+
+    def current_profits(self, mult_now):
+        n = self.size
+        profits = np.where(self.is_open[:n], self.amounts[:n] * mult_now, self.profits[:n])
+        return np.round(profits, 2)
 
     def to_dataframe(self):
-        temp = []
-        for elem in self.to_list:
-            temp.append(elem.to_dict())
-
-        return pd.DataFrame(temp)
+        return pd.DataFrame(self.to_list_of_dict())
 
     def to_list_of_dict(self):
-        final = []
-        for bet in self.to_list:
-            final.append(bet.to_dict())
-        return final
+        return [dict(zip(BET_COLUMNS, row)) for row in self.to_list_of_tuples("")]
+
+    def to_last_bets(self):
+        n = self.size
+        return [
+            {"address": address, "amount": amount, "profit": profit, "haswon": haswon}
+            for address, amount, profit, haswon in zip(
+                self.addresses,
+                self.amounts[:n].tolist(),
+                self.profits[:n].tolist(),
+                self.haswon[:n].tolist(),
+            )
+        ]
 
     def to_list_of_tuples(self, gamehash):
-        final = []
-        for bet in self.to_list:
-            final.append(bet.to_tuple(gamehash))
-
-        return final
+        n = self.size
+        states = ["open" if is_open else "closed" for is_open in self.is_open[:n].tolist()]
+        return [
+            (timestamp, gamehash, address, amount, haswon, 0, profit, state)
+            for timestamp, address, amount, haswon, profit, state in zip(
+                self.timestamps,
+                self.addresses,
+                self.amounts[:n].tolist(),
+                self.haswon[:n].tolist(),
+                self.profits[:n].tolist(),
+                states,
+            )
+        ]
 
     def add_bet(self, bet):
-        final = self.to_list
-        merged = False
+        i = self.index.get(bet.address)
+        if i is None:
+            i = self._insert(bet.address, bet.amount, bet.timestamp)
+        else:
+            self.amounts[i] += bet.amount
+        return self._bet_at(i)
 
-        for old_bet in final:
-            if old_bet.address == bet.address:
-                old_bet.merge(bet)
-                merged = True
+    def cashout(self, address, mult):
+        i = self.index.get(address)
+        if i is None or not self.is_open[i]:
+            return None
+
+        self.is_open[i] = False
+        self.open_count -= 1
+        if mult <= 0:
+            self.haswon[i] = False
+            self.cashout_mults[i] = 0
+            self.profits[i] = -1 * self.amounts[i]
+        else:
+            self.haswon[i] = True
+            self.cashout_mults[i] = mult
+            self.profits[i] = self.amounts[i] * mult
+        return self._bet_at(i)
+
+    def close_all(self, mult=-1):
+        """
+        Cashes out every open bet at mult in one vectorized pass. A mult
+        of zero or below closes them as lost.
+        """
+        if self.open_count == 0:
+            return
 
-        if not merged:
-            final.append(bet)
-            setattr(self, "to_list", final)
+        n = self.size
+        is_open = self.is_open[:n]
+        if mult <= 0:
+            self.haswon[:n][is_open] = False
+            self.cashout_mults[:n][is_open] = 0
+            self.profits[:n][is_open] = -1 * self.amounts[:n][is_open]
+        else:
+            self.haswon[:n][is_open] = True
+            self.cashout_mults[:n][is_open] = mult
+            self.profits[:n][is_open] = self.amounts[:n][is_open] * mult
+        is_open[:] = False
+        setattr(self, "open_count", 0)
+
+    def _insert(self, address, amount, timestamp):
+        if self.size == self.amounts.shape[0]:
+            self._grow()
+
+        i = self.size
+        self.index[address] = i
+        self.addresses.append(address)
+        self.timestamps.append(timestamp)
+        self.amounts[i] = amount
+        self.is_open[i] = True
+        self.size += 1
+        self.open_count += 1
+        return i
+
+    def _grow(self):
+        capacity = max(1, self.amounts.shape[0]) * 2
+        for col in ["amounts", "is_open", "haswon", "cashout_mults", "profits"]:
+            old = getattr(self, col)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[: old.shape[0]] = old
+            setattr(self, col, new)
+
+    def _bet_at(self, i):
+        bet = Bet(self.addresses[i], float(self.amounts[i]), self.timestamps[i])
+        if not self.is_open[i]:
+            setattr(bet, "state", "closed")
+            setattr(bet, "haswon", bool(self.haswon[i]))
+            setattr(bet, "cashout_mult", float(self.cashout_mults[i]))
+            setattr(bet, "profit", float(self.profits[i]))
+        return bet
 
 
 class Bet:
-    """docstring for Bet"""
-
-    def __init__(self, address, amount):
+    """
+    A single bet. The book stores bets column-wise, so instances are
+    lightweight records for incoming bets and for reading a row back.
+    """
+
+    __slots__ = (
+        "address",
+        "amount",
+        "timestamp",
+        "hash",
+        "multiplier",
+        "state",
+        "haswon",
+        "profit",
+        "cashout_mult",
+    )
+    cols = BET_COLUMNS
+
+    def __init__(self, address, amount, timestamp=None):
         self.address = address
         self.amount = amount
-        self.timestamp = datetime.now().isoformat()
+        self.timestamp = timestamp or datetime.now().isoformat()
         self.multiplier = 0
         self.state = "open"
         self.haswon = False
         self.profit = 0
-        self.cols = [
-            "timestamp",
-            "hash",
-            "address",
-            "amount",
-            "haswon",
-            "multiplier",
-            "profit",
-            "state",
-        ]
 
     def to_dict(self):
 
@@ -130,181 +315,235 @@ class Bet:
 class Game:
     """docstring for Game"""
 
-    def __init__(self):
-        self.data = GameHistory()
+    def __init__(self, data=None):
+        self.data = data or GameHistory()
+        self.chain = HashChain.open()
+        self.chain_position = None
+        self.settlements = SettlementQueue(self.data, on_settled=self.sync_house_balance)
+        # built in a worker thread at startup, the first round is
+        # announced by main.bootstrap once it is back on the event loop
+        self._setup_round()
+
+    def new_round(self):
+        self._setup_round()
+        hub.emit("state", **self.state_fields())
+
+    def _setup_round(self):
         self.identifier = self._get_id()
         self.set_next_hash_and_mult()
 
-        while self.multiplier > 500:
+        while self.multiplier > MAX_CRASH_MULTIPLIER:
             self.set_next_hash_and_mult(self.hash)
 
         self.state = "bet"
         self.has_players = False
-        self.delay = 0.1
+        self.delay = TICK_INTERVAL
         self.payout = False
         self.afterCrash = "crash"
         self.bets = Bets()
-        self.start_time = datetime.now() + timedelta(seconds=BETTING_STAGE_DURATION)
+        self.bets_close_at = time.monotonic() + BETTING_STAGE_DURATION
         self.start_game = False
         self.forced_change = False
+        self.ended_round = None
+        self.round_queued = False
         self.house_address = REWARDS_WALLET
         self.house_balance = self.get_house_balance()
-        self.set_mult_array()
-
-    def _connect_elrond_wallet(self):
-        elrond_proxy, elrond_account = get_proxy_and_account()
-        setattr(self, "elrond_account", elrond_account)
-        setattr(self, "elrond_proxy", elrond_proxy)
-
-    def set_mult_array(self):
-        assert hasattr(self, "multiplier")
+        self.reset_clock()
 
-        if self.multiplier == 1:
-            mult_array = [1, 1, -1]
-        else:
-            mult_array = np.arange(1, self.multiplier + 0.01, 0.01)
-
-        setattr(self, "mult_array", mult_array)
+    def reset_clock(self):
         setattr(self, "runtime_index", 0)
-        setattr(self, "multiplier_now", mult_array[0])
-
-    def iterate_game(self):
-        delays = [0.07, 0.025, 0.01]
-
+        setattr(self, "multiplier_now", 1.0)
+        setattr(self, "elapsed", 0.0)
+        setattr(self, "play_started", time.monotonic())
+
+    def iterate_game(self, elapsed=None):
+        """
+        Advances the round to elapsed seconds since play started, the
+        scheduler's grid time, or the monotonic clock when not given
+        """
         assert hasattr(self, "runtime_index")
         assert hasattr(self, "multiplier_now")
-        assert hasattr(self, "mult_array")
+        assert hasattr(self, "play_started")
 
         i = self.runtime_index
 
         if i < 0:
             return
 
-        bets_closed = all([bet.state == "closed" for bet in self.bets.to_list])
+        bets_closed = self.bets.open_count == 0
         setattr(self, "bets_closed", bets_closed)
 
-        if self.multiplier > 50 and not self.forced_change:
+        if self.multiplier > REROLL_ABOVE and not self.forced_change:
             if (self.has_players and bets_closed) or (not self.has_players):
                 old_mult = self.multiplier
-                setattr(self, "multiplier", round(random.uniform(55, 100), 2))
-                self.set_mult_array()
+                setattr(self, "multiplier", reroll_multiplier())
                 setattr(self, "has_players", True)
                 setattr(self, "forced_change", True)
                 logger.info(f"Multiplier changed from {old_mult} to {self.multiplier} due to NO active bets")
 
         mult_now = self.multiplier_now
-        player_potential_wins = 0
-        total_bets = 0
+        total_bets, player_potential_wins = self.bets.aggregates(mult_now)
 
-        for bet in self.bets.to_list:
-            total_bets += bet.amount
-            if bet.haswon:
-                player_potential_wins += bet.profit
-            else:
-                player_potential_wins += bet.amount * mult_now
+        if elapsed is None:
+            elapsed = time.monotonic() - self.play_started
+        setattr(self, "elapsed", elapsed)
+        next_mult = multiplier_at(self.elapsed)
 
-        if i >= len(self.mult_array) - 1:
+        if next_mult >= self.multiplier:
+            setattr(self, "multiplier_now", self.multiplier)
             setattr(self, "runtime_index", -1)
         else:
-            setattr(
-                self,
-                "multiplier_now",
-                float(format(self.mult_array[i + 1], ".2f")),
-            )
+            setattr(self, "multiplier_now", next_mult)
             setattr(self, "runtime_index", i + 1)
 
-        if player_potential_wins > 0.25 * (self.house_balance + total_bets):
+        if must_force_crash(player_potential_wins, self.house_balance, total_bets):
             logger.debug(f"Forced CRASH at multiplier:\t{self.multiplier_now}")
             logger.debug(f"Player profits lost:\t{player_potential_wins} EGLD")
             setattr(self, "multiplier", self.multiplier_now)
             setattr(self, "runtime_index", -1)
 
-        if 0 < mult_now < 2:
-            setattr(self, "delay", delays[0])
-        elif 2 <= mult_now < 3.5:
-            setattr(self, "delay", delays[1])
-        elif mult_now >= 3.5:
-            setattr(self, "delay", delays[2])
-
     def get_countdown_as_str(self):
         if self.state != "bet":
             return "00:00"
-        else:
-            cdown = self.start_time - datetime.now()
-            if datetime.now() > self.start_time:
-                return "00:00"
-
-            s = str(cdown)
-            s = s.split(".")
-            s = s[0] + "." + s[1][:2]
-            s = s.replace("0:00:", "")
-            s = s.replace(".", ":")
 
-            if s.startswith("-1 day"):
-                s = "00:00"
+        remaining = self.bets_close_at - time.monotonic()
+        if remaining <= 0:
+            return "00:00"
 
-            return s
+        # seconds:hundredths, e.g. "12:34"
+        hundredths = int(remaining * 100)
+        return f"{hundredths // 100:02d}:{hundredths % 100:02d}"
 
     def toggle_state(self):
         curr_state = self.state
 
         if curr_state == "bet":
             setattr(self, "state", "play")
+            self.reset_clock()
         elif curr_state == "play":
             setattr(self, "state", "end")
         elif curr_state == "end":
-            self.__init__()
+            self.new_round()
+
+        if curr_state != "end":
+            hub.emit("state", **self.state_fields())
 
         logger.info(f"Game state: \t{self.state}")
-        bets = [bet.to_dict() for bet in self.bets.to_list]
+        bets = self.bets.to_list_of_dict()
         logger.info(str(bets))
 
     def _get_id(self):
         if self.data.game_history.empty:
             return 0
         else:
-            gameid = self.data.game_history["id"].values[-1] + 1
+            gameid = int(self.data.game_history["id"].values[-1]) + 1
         return gameid
 
     def get_house_balance(self):
+        """
+        Returns the last known house balance without touching the chain.
+        The on-chain value is refreshed by sync_house_balance.
+        """
+        if self.data.game_history.empty:
+            balance = STARTING_WALLET_AMT
+        elif hasattr(self, "house_balance"):
+            balance = self.house_balance
+        else:
+            balance = float(self.data.game_history["house_balance"].values[-1])
+
+        logger.info("New game initiated!")
+        logger.info(f"House balance is:\t{balance}")
+        logger.info(f"Game state:\t{self.state}")
+        return balance
+
+    async def sync_house_balance(self):
+        if self.data.game_history.empty:
+            return self.house_balance
+
         try:
-            if self.data.game_history.empty:
-                balance = STARTING_WALLET_AMT
-            else:
-                req_url = ELROND_API + f"/address/{self.house_address}"
-                req = get_http_request(req_url)
-                req.raise_for_status()
-                req = json.loads(req.text)
-                balance = float(req["data"]["account"]["balance"]) / 10 ** 18
-            logger.info("New game initiated!")
-            logger.info(f"House balance is:\t{balance}")
-            logger.info(f"Game state:\t{self.state}")
-            return balance
+            req_url = ELROND_API + f"/address/{self.house_address}"
+            req = await get_http_request(req_url)
+            req.raise_for_status()
+            req = json.loads(req.text)
+            balance = float(req["data"]["account"]["balance"]) / 10 ** 18
+            if self.settlements.unconfirmed:
+                # the chain does not reflect the rounds still settling yet
+                logger.info(f"House balance sync skipped, {self.settlements.unconfirmed} rounds settling")
+                return self.house_balance
+            setattr(self, "house_balance", balance)
+            logger.info(f"House balance synced:\t{balance}")
         except Exception:
-            balance = self.data.game_history["house_balance"].iloc[-1:, :].values[0]
             traceback.print_exc()
-            return balance
+
+        return self.house_balance
+
+    def state_fields(self):
+        if hasattr(self, "isPaused") and self.isPaused:
+            state = "paused"
+        else:
+            state = self.state
+
+        return {
+            "gameState": state,
+            "betTimer": self.get_countdown_as_str(),
+            "afterCrash": self.afterCrash,
+        }
 
     def cashout(self, wallet):
-        for bet in self.bets.to_list:
-            if bet.address == wallet and bet.state == "open":
-                bet.cashout(self.multiplier_now)
+        bet = self.bets.cashout(wallet, self.multiplier_now)
+        if bet is None:
+            return
 
-    def set_next_hash_and_mult(self, given_hash=''):
-        def get_result(game_hash):
-            hm = hmac.new(str.encode(game_hash), b"", hashlib.sha256)
-            hm.update(game_hash.encode("utf-8"))
-            gme_hex = hm.hexdigest()
+        hub.emit(
+            "cashout",
+            walletAddress=bet.address,
+            betAmount=bet.amount,
+            profit=float(format(bet.profit, ".2f")),
+            multiplier="{:.2f}".format(bet.cashout_mult),
+        )
+
+    def update_bets(self, new_bets: dict):
+        for bet in self.bets.update(new_bets):
+            hub.emit("bet", walletAddress=bet.address, betAmount=bet.amount)
+
+    def _next_chain_entry(self):
+        if self.chain is None:
+            return None
+
+        if self.chain_position is None:
+            if self.data.game_history.empty:
+                # nothing to match the file against, so check it starts
+                # where this deployment's chain does
+                if len(self.chain) == 0 or self.chain.hash_at(0) != get_result(SALT_HASH)[0]:
+                    logger.warning("Hash chain file was not generated from SALT_HASH, deriving hashes per round")
+                    setattr(self, "chain", None)
+                    return None
+                last_position = -1
+            else:
+                last_hash = self.data.game_history["hash"].values[-1]
+                last_position = self.chain.position_of(last_hash)
+
+            if last_position is None:
+                logger.warning("Last game hash is not in the hash chain file, deriving hashes per round")
+                setattr(self, "chain", None)
+                return None
+            setattr(self, "chain_position", last_position)
 
-            if int(gme_hex, 16) % 33 == 0:
-                return gme_hex, 1
+        entry = self.chain.next_after(self.chain_position)
+        if entry is None:
+            logger.warning("Reached the end of the hash chain file, deriving hashes per round")
+            setattr(self, "chain", None)
+            return None
 
-            h = int(gme_hex[:13], 16)
-            e = 2 ** 52
-            result = (((100 * e - h) / (e - h)) // 1) / 100.0
-            return gme_hex, result
+        setattr(self, "chain_position", entry[0])
+        return entry[1], entry[2]
+
+    def set_next_hash_and_mult(self, given_hash=''):
+        entry = None if given_hash else self._next_chain_entry()
 
-        if given_hash:
+        if entry is not None:
+            gme_hash, multiplier = entry
+        elif given_hash:
             gme_hash, multiplier = get_result(given_hash)
         elif self.data.game_history.empty:
             gme_hash, multiplier = get_result(SALT_HASH)
@@ -318,7 +557,7 @@ class Game:
 
     async def countdown_bets_timer(self):
         while True:
-            if datetime.now() > self.start_time and self.state == "bet":
+            if time.monotonic() > self.bets_close_at and self.state == "bet":
                 self.toggle_state()
                 return
             await asyncio.sleep(1)
@@ -339,65 +578,64 @@ class Game:
         return new_state
 
     def get_current_bets(self):
-        if len(self.bets.to_list) == 0:
+        bets = self.bets
+        if len(bets) == 0:
             return []
-        final = []
-        for bet in self.bets.to_list:
-            if bet.state == "open":
-                profit = float(np.sum(bet.amount) * self.multiplier_now)
-            else:
-                profit = bet.profit
 
-            bet = {
-                "walletAddress": bet.address,
-                "betAmount": bet.amount,
-                "profit": float(format(profit, ".2f")),
-                "state": bet.state,
+        n = bets.size
+        rows = zip(
+            bets.addresses,
+            bets.amounts[:n].tolist(),
+            bets.current_profits(self.multiplier_now).tolist(),
+            bets.is_open[:n].tolist(),
+        )
+        final = [
+            {
+                "walletAddress": address,
+                "betAmount": amount,
+                "profit": profit,
+                "state": "open" if is_open else "closed",
             }
-            final.append(bet)
-
+            for address, amount, profit, is_open in rows
+        ]
         final.reverse()
         return final
 
+    def to_frame(self):
+        if hasattr(self, "isPaused") and self.isPaused:
+            return {
+                "gameState": "paused",
+                "multiplier": -2,
+                "activeBets": [],
+                "lastBets": self.data.get_last_game_bets(),
+                "betTimer": "",
+            }
+
+        return {
+            "gameState": self.state,
+            "multiplier": "{:.2f}".format(self.multiplier_now),
+            "elapsed": round(self.elapsed, 3),
+            "curve": CURVE_SEGMENTS,
+            "activeBets": self.get_current_bets(),
+            "lastBets": self.data.get_last_game_bets(),
+            "betTimer": self.get_countdown_as_str(),
+            "afterCrash": self.afterCrash,
+        }
+
     def force_cashout(self):
-        for bet in self.bets.to_list:
-            if bet.state == "open":
-                bet.cashout(-1)
-
-    def send_profits(self):
-        adds = {}
-        for bet in self.bets.to_list:
-            adds.update({bet.address: bet.cashout_mult})
-
-        self._connect_elrond_wallet()
-        self.elrond_account.sync_nonce(self.elrond_proxy)
-        tx_hash = send_rewards(self.elrond_account, adds)
-        if tx_hash:
-            setattr(self, "tx_hash", tx_hash)
-        else:
-            setattr(self, "tx_hash", "")
-        return tx_hash
+        self.bets.close_all(-1)
 
     async def confirm_5_seconds(self):
-        trigger = datetime.now() + timedelta(seconds=5)
-
-        while datetime.now() < trigger:
-            await asyncio.sleep(1)
+        await asyncio.sleep(5)
 
         setattr(self, "afterCrash", "notCrash")
+        hub.emit("state", **self.state_fields())
         return True
 
     async def end_game(self, manual=False):
         self.toggle_state()
         setattr(self, "afterCrash", "crash")
-        pool_size = 0
-        player_profits = 0
-
-        for bet in self.bets.to_list:
-            pool_size += bet.amount
-            if bet.haswon:
-                player_profits += bet.profit
-
+        pool_size, player_profits = self.bets.totals()
         self.force_cashout()
 
         house_profits = pool_size - player_profits
@@ -407,19 +645,35 @@ class Game:
         setattr(self, "pool_size", pool_size)
         setattr(self, "house_balance", self.house_balance + house_profits)
 
+        setattr(self, "tx_hash", "")
+
         if manual:
             logger.warning("MANUALLY crashed the game")
 
-        tx_hash = self.send_profits()
+        setattr(self, "ended_round", (self.to_tuple(), self.bets.to_list_of_tuples(self.hash)))
+        await self.close_round()
+
+    async def close_round(self):
+        """
+        Queues the settlement of the round that just ended and starts the
+        next one. A call interrupted by an error can be repeated, see
+        RoundScheduler.run.
+        """
+        # payout, confirmation and the database save run in the background
+        game_row, bets = self.ended_round
+        if not self.round_queued:
+            await self.settlements.put(Settlement.for_round(self.identifier, self.bets.payouts(), game_row, bets))
+            setattr(self, "round_queued", True)
         await self.confirm_5_seconds()
-        while not await confirm_transaction(tx_hash):
-            logger.info(f"Tx: {tx_hash} Failed to be confirmed. Retrying...")
-            tx_hash = self.send_profits()
-            logger.info(f"New Tx: {tx_hash}")
 
-        self.save_game_history()
-        self.save_bets_history()
-        self.__init__()
+        self.record_history(game_row, bets)
+        hub.emit(
+            "result",
+            multiplier="{:.2f}".format(self.multiplier),
+            hash=self.hash,
+            lastBets=self.data.get_last_game_bets(),
+        )
+        self.new_round()
 
     async def confirm_payouts(self):
         while True:
@@ -427,16 +681,12 @@ class Game:
             if self.payout:
                 return
 
-    def save_game_history(self):
-        logger.info("Saving history: ")
-        self.data.db.add_row("games_2023", self.to_tuple())
-
-    def save_bets_history(self):
-        bets = self.bets.to_list_of_tuples(self.hash)
-        logger.info(f"Saving bets:\t{bets}")
+    def record_history(self, game_row, bets):
+        logger.info(f"Recording history: game {self.identifier} with {len(bets)} bets")
 
-        for elem in bets:
-            self.data.db.add_row("bets", elem)
+        self.data.append_game(game_row)
+        self.data.append_bets(bets)
+        self.data.set_last_game_bets(self.bets.to_last_bets())
 
     def to_dict(self):
         cols = self.data.map["games"].keys()
@@ -464,7 +714,7 @@ class Game:
     ):
         cols = self.data.map["bets"].keys()
         final = []
-        for elem in self.bets.to_list:
+        for elem in self.bets.to_list_of_dict():
             dic = []
             for col in cols:
                 if col in elem.keys():
@@ -483,6 +733,7 @@ class Game:
 
         setattr(bet, "hash", self.hash)
         self.bets.add_bet(bet)
+        hub.emit("bet", walletAddress=bet.address, betAmount=bet.amount)
 
         # new_bets = self.bets
         # new_bet = bet.to_dict()
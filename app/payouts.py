@@ -0,0 +1,151 @@
+"""
+Payout transactions for rounds of any size.
+
+A multiplyFunds transaction pays REWARD_GAS_PER_ENTRY per winner, so a
+single transaction for a large round runs into the per-transaction gas
+limit and fails as one unit. Payouts are split into chunks of at most
+PAYOUT_CHUNK_SIZE entries, signed with consecutive nonces counted
+locally from the wallet's current one, and submitted concurrently.
+Every transaction is confirmed on its own, so only chunks that failed
+are paid again.
+
+A signed transaction is only ever submitted again as it is: a nonce can
+be executed once, so resubmitting never pays twice. SettlementQueue
+stores the signed transactions before submitting them, so this holds
+across restarts too.
+"""
+import asyncio
+import logging
+
+import httpx
+
+import elrond
+from vars import PAYOUT_CHUNK_SIZE, PAYOUT_CONFIRM_TIMEOUT, SETTLEMENT_RETRY_DELAY
+
+logger = logging.getLogger("fastapi")
+logger.setLevel(logging.DEBUG)
+
+# the most entries whose gas still fits in one transaction
+MAX_CHUNK_SIZE = elrond.MAX_GAS_LIMIT // elrond.REWARD_GAS_PER_ENTRY - 1
+
+
+def chunk_payouts(payouts, size=PAYOUT_CHUNK_SIZE):
+    """
+    Splits payouts, a mapping of address to multiplier, into mappings of
+    at most size entries. A round without bets still gets one empty
+    chunk: the contract call closes the round.
+    """
+    size = max(1, min(size, MAX_CHUNK_SIZE))
+    items = list(payouts.items())
+    return [dict(items[i:i + size]) for i in range(0, len(items), size)] or [{}]
+
+
+def _sign(account, chunks, nonce):
+    return [elrond.rewards_transaction(account, chunk, nonce + i) for i, chunk in enumerate(chunks)]
+
+
+class PayoutBatcher:
+    def __init__(self, retry_delay=SETTLEMENT_RETRY_DELAY, submit_attempts=5, confirm_timeout=PAYOUT_CONFIRM_TIMEOUT):
+        self.retry_delay = retry_delay
+        self.submit_attempts = submit_attempts
+        self.confirm_timeout = confirm_timeout
+
+    async def sign(self, chunks, min_nonce=0):
+        """
+        Signs one transaction per chunk, with consecutive nonces starting
+        at the house wallet's current one
+
+        Params:
+            - chunks: the payouts of each transaction
+            - min_nonce: the first nonce not given to a transaction that
+              may still execute, if above the wallet's
+
+        Returns:
+            The signed transactions, in the order of chunks
+        """
+        loop = asyncio.get_running_loop()
+        # the wallet may still be loading when the first round settles
+        _, account = await loop.run_in_executor(None, elrond.connect)
+        nonce = max(await elrond.get_nonce(account.address.bech32()), min_nonce)
+        return await loop.run_in_executor(None, _sign, account, chunks, nonce)
+
+    async def submit(self, payloads):
+        """
+        Submits signed transactions all at once
+
+        Returns:
+            The hash of each transaction, or None where the gateway did
+            not take it; that one is to be submitted again as it is
+        """
+        results = await asyncio.gather(*(self._submit(payload) for payload in payloads), return_exceptions=True)
+        tx_hashes = []
+        for payload, result in zip(payloads, results):
+            if isinstance(result, Exception):
+                logger.error(f"Submitting transaction with nonce {payload['nonce']} failed:\t{result!r}")
+                result = None
+            tx_hashes.append(result)
+        return tx_hashes
+
+    async def _submit(self, payload):
+        for attempt in range(1, self.submit_attempts + 1):
+            try:
+                return await elrond.send_transaction(payload)
+            except httpx.HTTPStatusError as e:
+                # rejected, e.g. for a nonce that is used up because an
+                # earlier submit of this same transaction went through
+                tx_hash = await self._sent_before(payload)
+                if tx_hash is not None:
+                    return tx_hash
+                logger.warning(f"Transaction with nonce {payload['nonce']} rejected:\t{e.response.text}")
+            except httpx.HTTPError as e:
+                logger.warning(f"Submitting transaction with nonce {payload['nonce']} failed:\t{e!r}")
+
+            if attempt < self.submit_attempts:
+                await asyncio.sleep(self.retry_delay)
+        return None
+
+    async def _sent_before(self, payload):
+        """
+        Returns the hash the transaction got when it was submitted before,
+        or None if its nonce is still free or the API does not list it yet
+        """
+        if await elrond.get_nonce(payload["sender"]) <= payload["nonce"]:
+            return None
+        return await elrond.find_transaction(payload["sender"], payload["nonce"])
+
+    async def confirm(self, sent):
+        """
+        Waits for every transaction to be executed, each for at most
+        confirm_timeout seconds
+
+        Params:
+            - sent: (hash, signed transaction) of each transaction
+
+        Returns:
+            For each one, in order: True if it succeeded, False if it
+            failed or can no longer execute, so it is to be signed again,
+            and None if it may still execute, so it is to be submitted
+            again as it is
+        """
+        results = await asyncio.gather(*(self._confirm(*tx) for tx in sent), return_exceptions=True)
+        confirmed = []
+        for (tx_hash, _), result in zip(sent, results):
+            if isinstance(result, Exception):
+                logger.error(f"Confirming transaction {tx_hash} failed:\t{result!r}")
+                result = None
+            confirmed.append(result)
+        return confirmed
+
+    async def _confirm(self, tx_hash, payload):
+        ok = await elrond.confirm_transaction(tx_hash, self.confirm_timeout)
+        if ok is not None:
+            return ok
+        # not executed in time: only once another transaction used up its
+        # nonce can it never execute and be paid again with a new one
+        if await elrond.get_nonce(payload["sender"]) <= payload["nonce"]:
+            return None
+        executed = await elrond.find_transaction(payload["sender"], payload["nonce"])
+        if executed is None or executed == tx_hash:
+            return None
+        logger.warning(f"Nonce {payload['nonce']} of transaction {tx_hash} was used by {executed}")
+        return False
@@ -0,0 +1,157 @@
+import threading
+from bisect import bisect_right
+from datetime import date, datetime, time
+
+EPOCH = datetime(1970, 1, 1)
+USER_PROFILE_COLS = [
+    "discord_name",
+    "discord_id",
+    "avatar_hash",
+    "exp",
+    "raffle_tickets",
+    "title",
+]
+
+
+class PlayerRecord:
+    """
+    A player's user record and time-ordered bets.
+
+    Next to the bet timestamps and profits it keeps the running maxima
+    seen from the newest bet backwards: each peak is a bet that no later
+    bet beats. The best win after any instant is the first peak after
+    it, found by binary search, and the number of games is a position
+    difference.
+    """
+
+    __slots__ = ("user", "timestamps", "profits", "peak_timestamps", "peak_profits")
+
+    def __init__(self):
+        self.user = None
+        self.timestamps = []
+        self.profits = []
+        self.peak_timestamps = []
+        self.peak_profits = []
+
+    def add_bet(self, timestamp, profit):
+        if self.timestamps and timestamp < self.timestamps[-1]:
+            i = bisect_right(self.timestamps, timestamp)
+            self.timestamps.insert(i, timestamp)
+            self.profits.insert(i, profit)
+            self._rebuild_peaks()
+            return
+
+        self.timestamps.append(timestamp)
+        self.profits.append(profit)
+        self._push_peak(timestamp, profit)
+
+    def stats_since(self, from_ts):
+        """
+        Returns (top_win, total_games) over the bets strictly after from_ts
+        """
+        total_games = len(self.timestamps) - bisect_right(self.timestamps, from_ts)
+        if total_games == 0:
+            return 0, 0
+
+        i = bisect_right(self.peak_timestamps, from_ts)
+        return self.peak_profits[i], total_games
+
+    def _push_peak(self, timestamp, profit):
+        while self.peak_profits and self.peak_profits[-1] <= profit:
+            self.peak_profits.pop()
+            self.peak_timestamps.pop()
+        self.peak_timestamps.append(timestamp)
+        self.peak_profits.append(profit)
+
+    def _rebuild_peaks(self):
+        self.peak_timestamps = []
+        self.peak_profits = []
+        for timestamp, profit in zip(self.timestamps, self.profits):
+            self._push_peak(timestamp, profit)
+
+
+class PlayerIndex:
+    """
+    Address -> PlayerRecord index behind /userProfile.
+
+    Updated as users are upserted and rounds are saved, so profile reads
+    never scan the bet or user tables. Profiles are read on the query
+    threads while rounds are added on the event loop, so every access
+    holds the lock.
+    """
+
+    def __init__(self):
+        self.players = {}
+        self.bet_count = 0
+        self.lock = threading.Lock()
+
+    def _record(self, address):
+        record = self.players.get(address)
+        if record is None:
+            record = PlayerRecord()
+            self.players[address] = record
+        return record
+
+    def get_user(self, address):
+        with self.lock:
+            record = self.players.get(address)
+            if record is None:
+                return None
+            return record.user
+
+    def set_user(self, user: dict):
+        with self.lock:
+            self._record(user["address"]).user = user
+
+    def load_users(self, users):
+        for user in users:
+            self.set_user(user)
+
+    def add_bets(self, rows):
+        """
+        Params:
+        rows (iterable): (timestamp, address, profit) tuples
+        """
+        rows = [(to_seconds(timestamp), address, float(profit)) for timestamp, address, profit in rows]
+        with self.lock:
+            self._add_bets(rows)
+
+    def reindex(self, rows):
+        """
+        Replaces every player's bets with rows, (timestamp, address,
+        profit) tuples, in one step: a reader sees either the old bets or
+        the new ones
+        """
+        rows = [(to_seconds(timestamp), address, float(profit)) for timestamp, address, profit in rows]
+        with self.lock:
+            self._clear_bets()
+            self._add_bets(rows)
+
+    def _add_bets(self, rows):
+        for timestamp, address, profit in rows:
+            self._record(address).add_bet(timestamp, profit)
+            self.bet_count += 1
+
+    def _clear_bets(self):
+        for record in self.players.values():
+            record.timestamps = []
+            record.profits = []
+            record.peak_timestamps = []
+            record.peak_profits = []
+        setattr(self, "bet_count", 0)
+
+    def stats_since(self, address, from_ts):
+        from_ts = to_seconds(from_ts)
+        with self.lock:
+            record = self.players.get(address)
+            if record is None:
+                return 0, 0
+            return record.stats_since(from_ts)
+
+
+def to_seconds(value):
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    elif not isinstance(value, datetime) and isinstance(value, date):
+        value = datetime.combine(value, time())
+    return (value - EPOCH).total_seconds()
@@ -0,0 +1,53 @@
+"""
+Startup readiness of the external dependencies.
+
+Importing the app connects to nothing: the database, the chain wallet
+and the game engine are brought up in the startup phase, each marking
+itself here when warm. GET /ready reports this registry.
+"""
+import logging
+import time
+
+logger = logging.getLogger("fastapi")
+logger.setLevel(logging.DEBUG)
+
+COMPONENTS = ["db", "chain", "engine"]
+
+
+class Readiness:
+    def __init__(self, components=COMPONENTS):
+        self.started = time.monotonic()
+        self.components = {name: {"ready": False, "error": None, "seconds": None} for name in components}
+
+    def mark(self, name):
+        """
+        Marks a component as warm
+
+        Params:
+            - name: one of the registered components
+        """
+        component = self.components[name]
+        component.update(ready=True, error=None, seconds=round(time.monotonic() - self.started, 3))
+        logger.info(f"Startup: '{name}' ready after {component['seconds']}s")
+
+    def fail(self, name, error):
+        """
+        Records why a component is not warm yet
+
+        Params:
+            - name: one of the registered components
+            - error: the exception raised while bringing it up
+        """
+        self.components[name].update(ready=False, error=repr(error))
+        logger.warning(f"Startup: '{name}' not ready:\t{error!r}")
+
+    def is_ready(self, name=None):
+        if name is not None:
+            return self.components[name]["ready"]
+        return all(component["ready"] for component in self.components.values())
+
+    def to_dict(self):
+        return {"ready": self.is_ready(), "components": self.components}
+
+
+readiness = Readiness()
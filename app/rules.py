@@ -0,0 +1,23 @@
+"""
+House risk rules shared by the live game and the simulator.
+"""
+import random
+
+# a round is crashed once players could take home more than this share
+# of the house balance plus the round's pool
+FORCED_CRASH_RATIO = 0.25
+# crash points above REROLL_ABOVE are replaced once no bet is open
+REROLL_ABOVE = 50
+REROLL_RANGE = (55, 100)
+
+
+def forced_crash_threshold(house_balance, total_bets):
+    return FORCED_CRASH_RATIO * (house_balance + total_bets)
+
+
+def must_force_crash(player_potential_wins, house_balance, total_bets):
+    return player_potential_wins > forced_crash_threshold(house_balance, total_bets)
+
+
+def reroll_multiplier(rng=random):
+    return round(rng.uniform(*REROLL_RANGE), 2)
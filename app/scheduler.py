@@ -0,0 +1,220 @@
+"""
+Round and tick scheduling on the monotonic clock.
+
+Ticks fire on a fixed grid, origin + k * interval, instead of sleeping a
+fixed delay after each tick, so the time spent iterating and emitting
+does not accumulate into drift. A tick that wakes up late fires at once;
+if a whole interval or more was lost, the missed grid points are skipped
+rather than replayed, since the multiplier is a function of the elapsed
+time and a burst of stale ticks would carry no information. Wall-clock
+adjustments (NTP) move neither the tick grid nor the betting countdown.
+"""
+import asyncio
+import logging
+import time
+
+import metrics
+from broadcast import hub
+from elrond import get_all_bets
+from readiness import readiness
+from vars import TICK_INTERVAL, BETTING_DELAY, SETTLEMENT_STALL_TIMEOUT
+
+logger = logging.getLogger("fastapi")
+logger.setLevel(logging.DEBUG)
+
+
+class TickScheduler:
+    def __init__(self, interval=TICK_INTERVAL, clock=time.monotonic):
+        self.interval = interval
+        self.clock = clock
+        self.origin = None
+        self.index = 0
+        self.last_fired = None
+
+    def start(self, origin=None):
+        """
+        Starts a new grid, with tick 0 at origin
+
+        Params:
+            - origin: a clock() reading, now by default
+        """
+        setattr(self, "origin", self.clock() if origin is None else origin)
+        setattr(self, "index", 0)
+        setattr(self, "last_fired", None)
+
+    @property
+    def deadline(self):
+        return self.origin + self.index * self.interval
+
+    @property
+    def elapsed(self):
+        """
+        Grid time of the current tick, free of wake-up jitter
+        """
+        return self.index * self.interval
+
+    def advance(self, now):
+        """
+        Moves to the next grid point, skipping the ones already missed by
+        more than an interval
+
+        Returns:
+            The number of skipped grid points
+        """
+        setattr(self, "index", self.index + 1)
+        missed = int((now - self.deadline) // self.interval)
+        if missed > 0:
+            setattr(self, "index", self.index + missed)
+            return missed
+        return 0
+
+    async def wait(self):
+        """
+        Sleeps until the next tick is due and records how late it fired
+
+        Returns:
+            The index of the tick on the grid
+        """
+        now = self.clock()
+        skipped = self.advance(now)
+        if skipped:
+            metrics.ticks_skipped.inc(skipped)
+
+        if now < self.deadline:
+            await asyncio.sleep(self.deadline - now)
+        else:
+            metrics.tick_overruns.inc()
+            # still yield, so the websocket writers get to run
+            await asyncio.sleep(0)
+
+        fired = self.clock()
+        metrics.tick_jitter.observe(max(0.0, fired - self.deadline))
+        if self.last_fired is not None:
+            metrics.tick_interval.observe(fired - self.last_fired)
+        setattr(self, "last_fired", fired)
+        return self.index
+
+
+class RoundScheduler:
+    """
+    Drives a Game through bet -> play -> end. The betting stage closes
+    at game.bets_close_at, or once the previous round's payout is
+    confirmed if that takes longer, and play ticks run on a
+    TickScheduler grid anchored at the moment play started. A payout
+    still unconfirmed stall_timeout seconds past the deadline marks the
+    chain as not ready until it lands.
+    """
+
+    def __init__(
+        self,
+        game,
+        interval=TICK_INTERVAL,
+        poll_interval=BETTING_DELAY,
+        stall_timeout=SETTLEMENT_STALL_TIMEOUT,
+        clock=time.monotonic,
+    ):
+        self.game = game
+        self.clock = clock
+        self.poll_interval = poll_interval
+        self.stall_timeout = stall_timeout
+        self.stalled = False
+        self.ticks = TickScheduler(interval, clock)
+
+    async def run(self):
+        while True:
+            if self.paused():
+                await asyncio.sleep(1)
+                continue
+
+            if self.game.state == "bet":
+                await self.betting()
+            elif self.game.state == "play":
+                await self.playing()
+            elif self.game.ended_round is not None:
+                # a round whose end was interrupted by an error
+                await self.game.close_round()
+            else:
+                # a round left in "end" by toggleGameState
+                await asyncio.sleep(self.ticks.interval)
+
+    def paused(self):
+        return hasattr(self.game, "isPaused") and self.game.isPaused
+
+    async def betting(self):
+        """
+        Polls the contract for new bets until the stage closes, then
+        takes a last reading and starts play
+        """
+        game = self.game
+        if game.afterCrash == "notCrash":
+            setattr(game, "afterCrash", "crash")
+
+        while game.state == "bet" and not self.paused():
+            remaining = game.bets_close_at - self.clock()
+            if game.settlements.unconfirmed:
+                # until the last payout lands the contract still holds the
+                # previous round's bets; play waits for it past the deadline,
+                # a poll interval at a time so a pause is still honoured
+                try:
+                    timeout = min(self.poll_interval, remaining) if remaining > 0 else self.poll_interval
+                    await asyncio.wait_for(game.settlements.wait_confirmed(), timeout)
+                except asyncio.TimeoutError:
+                    self.check_stalled()
+                continue
+
+            if self.stalled:
+                setattr(self, "stalled", False)
+                logger.info(f"Payouts confirmed, round {game.identifier} can start")
+                readiness.mark("chain")
+
+            new_bets = await get_all_bets()
+            if game.state != "bet":
+                return
+            if new_bets and not game.has_players:
+                setattr(game, "has_players", True)
+            game.update_bets(new_bets)
+
+            remaining = game.bets_close_at - self.clock()
+            if remaining <= 0:
+                game.toggle_state()
+                return
+            await asyncio.sleep(min(self.poll_interval, remaining))
+
+    def check_stalled(self):
+        """
+        Reports the payouts as stalled once they are unconfirmed
+        stall_timeout seconds past the betting deadline
+        """
+        overdue = self.clock() - self.game.bets_close_at
+        if self.stalled or overdue < self.stall_timeout:
+            return
+
+        setattr(self, "stalled", True)
+        unconfirmed = self.game.settlements.unconfirmed
+        logger.error(
+            f"Round {self.game.identifier} has waited {overdue:.0f}s past its betting deadline for "
+            f"{unconfirmed} unconfirmed payouts"
+        )
+        readiness.fail("chain", TimeoutError(f"{unconfirmed} payouts unconfirmed for {overdue:.0f}s"))
+
+    async def playing(self):
+        game = self.game
+        self.ticks.start(game.play_started)
+
+        while game.state == "play":
+            if self.paused():
+                await asyncio.sleep(1)
+                continue
+
+            with metrics.iterate_duration.time():
+                game.iterate_game(self.ticks.elapsed)
+            hub.emit(
+                "tick",
+                multiplier="{:.2f}".format(game.multiplier_now),
+                elapsed=round(game.elapsed, 3),
+            )
+
+            if game.runtime_index == -1:
+                await game.end_game()
+                return
+            await self.ticks.wait()
@@ -0,0 +1,271 @@
+"""
+Background settlement of finished rounds.
+
+A round that ends is written to the settlements table with its payouts,
+split into transaction sized chunks, and its game and bet rows, and the
+next round starts right away. A single worker then works the queue in
+order: it signs the payout transactions (see payouts.py) and stores them
+before submitting anything, waits for each to be confirmed, pays only
+the chunks that failed again and saves the game and bet rows, marking
+the settlement done in the same transaction.
+
+Settlements that were not done when the process stopped are loaded back
+by GameHistory and resumed: stored transactions are submitted again as
+they are, never signed again, so none is paid twice. Until a round's payout is confirmed the
+contract still holds that round's bets, so the betting stage of the next
+round waits for it before reading bets (see RoundScheduler.betting).
+"""
+import asyncio
+import json
+import logging
+import time
+import traceback
+from datetime import datetime
+
+import metrics
+from payouts import PayoutBatcher, chunk_payouts
+from vars import DATABASE_MAP, SETTLEMENT_RETRY_DELAY
+
+logger = logging.getLogger("fastapi")
+logger.setLevel(logging.DEBUG)
+
+TX_HASH_COLUMN = list(DATABASE_MAP["games"]).index("tx_hash")
+
+# pending: saved, not signed yet; signed: transaction stored, not taken
+# by the gateway yet or not confirmed in time; sent: waiting for
+# confirmation; failed: rejected on chain or its nonce used by another
+# transaction, to be signed again with a new nonce; confirmed: executed
+# (chunks); settled: rows saved (settlements)
+PENDING, SIGNED, SENT, FAILED, CONFIRMED, SETTLED = "pending", "signed", "sent", "failed", "confirmed", "settled"
+
+
+class Settlement:
+    def __init__(self, game_id, chunks, game_row, bet_rows, status=PENDING, attempts=0, created=None):
+        self.id = game_id
+        self.chunks = [dict(chunk) for chunk in chunks]
+        self.game_row = tuple(game_row)
+        self.bet_rows = [tuple(row) for row in bet_rows]
+        self.status = status
+        self.attempts = attempts
+        self.created = created or datetime.now().isoformat()
+        # confirmation is not persisted, a resumed settlement asks again
+        self.confirmed = False
+        # whether the settlements table has the row
+        self.stored = True
+
+    @classmethod
+    def for_round(cls, game_id, payouts, game_row, bet_rows):
+        """
+        Builds the settlement of a finished round
+
+        Params:
+            - payouts: mapping of address to cashout multiplier
+            - game_row, bet_rows: the rows saved once it is paid
+        """
+        chunks = [
+            {"payouts": part, "tx_hash": "", "status": PENDING, "nonce": None, "tx": None}
+            for part in chunk_payouts(payouts)
+        ]
+        settlement = cls(game_id, chunks, game_row, bet_rows)
+        setattr(settlement, "stored", False)
+        return settlement
+
+    @classmethod
+    def from_row(cls, row):
+        """
+        Builds a Settlement from a settlements table row, as a dict
+        """
+        return cls(
+            int(row["id"]),
+            json.loads(row["chunks"]),
+            json.loads(row["game_row"]),
+            json.loads(row["bet_rows"]),
+            row["status"],
+            int(row["attempts"]),
+            row["created"],
+        )
+
+    def to_row(self):
+        return (
+            self.id,
+            self.created,
+            json.dumps(self.chunks),
+            json.dumps(self.game_row),
+            json.dumps(self.bet_rows),
+            self.status,
+            self.tx_hash,
+            self.attempts,
+        )
+
+    @property
+    def tx_hash(self):
+        """
+        The first payout transaction, the one recorded in the games table
+        """
+        return self.chunks[0]["tx_hash"]
+
+    def chunks_in(self, *statuses):
+        return [chunk for chunk in self.chunks if chunk["status"] in statuses]
+
+    def next_nonce(self):
+        """
+        The first nonce after the transactions that may still execute
+        """
+        return max((chunk["nonce"] + 1 for chunk in self.chunks_in(SIGNED, SENT)), default=0)
+
+    def settled_game_row(self):
+        row = list(self.game_row)
+        row[TX_HASH_COLUMN] = self.tx_hash
+        return tuple(row)
+
+
+class SettlementQueue:
+    """
+    Durable FIFO of rounds waiting for their payout. unconfirmed counts
+    the rounds whose payout transaction has not been confirmed yet.
+    """
+
+    def __init__(self, data, on_settled=None, batcher=None, retry_delay=SETTLEMENT_RETRY_DELAY):
+        self.data = data
+        self.on_settled = on_settled
+        self.batcher = batcher or PayoutBatcher(retry_delay)
+        self.retry_delay = retry_delay
+        self.queue = asyncio.Queue()
+        self.unconfirmed = 0
+        self.confirmed = asyncio.Event()
+        self.confirmed.set()
+        metrics.settlements_unconfirmed.set_function(lambda: self.unconfirmed)
+
+        for settlement in data.unsettled:
+            logger.info(f"Resuming settlement of game {settlement.id} ({settlement.status})")
+            self._push(settlement)
+
+    async def put(self, settlement):
+        """
+        Saves a finished round to the settlements table and queues it. If
+        the save fails the round is queued anyway and the worker saves it
+        before paying it, so a database outage does not stop the game.
+        """
+        try:
+            await self._store(settlement)
+        except Exception:
+            logger.exception(f"Saving the settlement of game {settlement.id} failed, it is retried before the payout")
+        self._push(settlement)
+
+    def _push(self, settlement):
+        setattr(self, "unconfirmed", self.unconfirmed + 1)
+        self.confirmed.clear()
+        self.queue.put_nowait((settlement, time.monotonic()))
+
+    def _mark_confirmed(self):
+        setattr(self, "unconfirmed", self.unconfirmed - 1)
+        if self.unconfirmed == 0:
+            self.confirmed.set()
+
+    async def wait_confirmed(self):
+        await self.confirmed.wait()
+
+    async def run(self):
+        while True:
+            settlement, queued_at = await self.queue.get()
+            while True:
+                try:
+                    await self.settle(settlement)
+                    break
+                except Exception:
+                    logger.exception(f"Settlement of game {settlement.id} failed, retrying:\t{traceback.format_exc()}")
+                    await asyncio.sleep(self.retry_delay)
+
+            metrics.settlement_duration.observe(time.monotonic() - queued_at)
+            if self.on_settled is not None and self.unconfirmed == 0:
+                await self.on_settled()
+
+    async def settle(self, settlement):
+        """
+        Signs, sends, confirms and saves one round. Resumes from the
+        recorded chunk statuses: a signed transaction is stored before it
+        is submitted and only ever submitted again as it is.
+        """
+        if not settlement.stored:
+            await self._store(settlement)
+
+        while settlement.status != SETTLED:
+            unsigned = settlement.chunks_in(PENDING, FAILED)
+            if unsigned:
+                payloads = await self.batcher.sign([chunk["payouts"] for chunk in unsigned], settlement.next_nonce())
+                for chunk, payload in zip(unsigned, payloads):
+                    chunk.update(tx=payload, nonce=payload["nonce"], tx_hash="", status=SIGNED)
+                setattr(settlement, "attempts", settlement.attempts + 1)
+                setattr(settlement, "status", SIGNED)
+                await self._save(settlement)
+
+            signed = settlement.chunks_in(SIGNED)
+            if signed:
+                tx_hashes = await self.batcher.submit([chunk["tx"] for chunk in signed])
+                for chunk, tx_hash in zip(signed, tx_hashes):
+                    if tx_hash is not None:
+                        chunk.update(tx_hash=tx_hash, status=SENT)
+                setattr(settlement, "status", SENT)
+                await self._save(settlement)
+                logger.info(f"Payout of game {settlement.id} sent in {len(signed)} transactions")
+
+                unsent = settlement.chunks_in(SIGNED)
+                if unsent:
+                    logger.warning(
+                        f"{len(unsent)} payout transactions of game {settlement.id} were not taken, submitting "
+                        f"them again"
+                    )
+                    await asyncio.sleep(self.retry_delay)
+                    continue
+
+            sent = settlement.chunks_in(SENT)
+            if sent:
+                results = await self.batcher.confirm([(chunk["tx_hash"], chunk["tx"]) for chunk in sent])
+                for chunk, ok in zip(sent, results):
+                    chunk["status"] = SIGNED if ok is None else CONFIRMED if ok else FAILED
+
+                unconfirmed = settlement.chunks_in(SIGNED)
+                if unconfirmed:
+                    logger.warning(
+                        f"{len(unconfirmed)} payout transactions of game {settlement.id} were not confirmed in "
+                        f"time, submitting them again"
+                    )
+                    setattr(settlement, "status", SIGNED)
+                    await self._save(settlement)
+                    await asyncio.sleep(self.retry_delay)
+                    continue
+
+            failed = settlement.chunks_in(FAILED)
+            if failed:
+                logger.info(
+                    f"{len(failed)} of {len(settlement.chunks)} payout transactions of game {settlement.id} "
+                    f"failed, resending them"
+                )
+                setattr(settlement, "status", FAILED)
+                await self._save(settlement)
+                await asyncio.sleep(self.retry_delay)
+                continue
+
+            if not settlement.confirmed:
+                setattr(settlement, "confirmed", True)
+                self._mark_confirmed()
+
+            await self.data.run(
+                self.data.db.save_round, settlement.settled_game_row(), settlement.bet_rows, settlement_id=settlement.id
+            )
+            setattr(settlement, "status", SETTLED)
+            self.data.round_saved(settlement.id, settlement.tx_hash, settlement.bet_rows)
+
+    async def _store(self, settlement):
+        await self.data.run(self.data.db.add_settlement, settlement.to_row())
+        setattr(settlement, "stored", True)
+
+    async def _save(self, settlement):
+        await self.data.run(
+            self.data.db.update_settlement,
+            settlement.id,
+            settlement.status,
+            json.dumps(settlement.chunks),
+            settlement.tx_hash,
+            settlement.attempts,
+        )
@@ -0,0 +1,266 @@
+"""
+Monte Carlo house-risk simulator.
+
+Replays synthetic rounds with the live game's economics: crash points
+from the provably-fair formula (verify.multipliers on random digests,
+skipping rounds above MAX_CRASH_MULTIPLIER), the multiplier curve sampled
+every TICK_INTERVAL, the forced crash and re-roll from rules.py and a
+house that starts at STARTING_WALLET_AMT.
+
+Many independent house-balance paths advance together, one round at a
+time, on NumPy arrays of shape (paths, bettors); paths are split across
+a process pool. Bettors auto-cashout at a target drawn from their group's
+strategy. Since a player's potential win is amount * min(multiplier,
+target), it only grows during a round, so the tick at which the forced
+crash fires is solved per path instead of stepping through ticks.
+
+    python -m simulate --paths 1000 --rounds 10000
+    python -m simulate --population groups.json --out report.json
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from curve import multiplier_at
+from rules import REROLL_ABOVE, forced_crash_threshold
+from verify import multipliers
+from vars import MAX_CRASH_MULTIPLIER, STARTING_WALLET_AMT, TICK_INTERVAL
+
+DEFAULT_POPULATION = [
+    {"name": "cautious", "bettors": 20, "participation": 0.6, "mean_bet": 0.5, "strategy": "fixed", "target": 1.5},
+    {"name": "steady", "bettors": 15, "participation": 0.5, "mean_bet": 1.0, "strategy": "uniform", "low": 1.5, "high": 5},
+    {"name": "chasers", "bettors": 5, "participation": 0.3, "mean_bet": 2.0, "strategy": "pareto", "low": 2, "high": 100},
+]
+
+
+def _fixed(rng, shape, group):
+    return np.full(shape, float(group["target"]))
+
+
+def _uniform(rng, shape, group):
+    return rng.uniform(group["low"], group["high"], shape)
+
+
+def _pareto(rng, shape, group):
+    # P(target > x) = low / x, the same odds shape as the crash point
+    return np.minimum(group["low"] / (1 - rng.random(shape)), group["high"])
+
+
+STRATEGIES = {
+    "fixed": _fixed,
+    "uniform": _uniform,
+    "pareto": _pareto,
+}
+
+
+def tick_grid():
+    """
+    Multipliers shown at each tick of a round, up to MAX_CRASH_MULTIPLIER
+    """
+    grid = [1.0]
+    while grid[-1] < MAX_CRASH_MULTIPLIER:
+        grid.append(multiplier_at(len(grid) * TICK_INTERVAL))
+    return np.array(grid)
+
+
+def crash_points(rng, n):
+    points = multipliers(rng.integers(0, 256, (n, 32), dtype=np.uint8))
+    skipped = points > MAX_CRASH_MULTIPLIER
+    while skipped.any():
+        points[skipped] = multipliers(rng.integers(0, 256, (int(skipped.sum()), 32), dtype=np.uint8))
+        skipped = points > MAX_CRASH_MULTIPLIER
+    return points
+
+
+def forced_crash_points(grid, amounts, cashouts, threshold):
+    """
+    Returns the multiplier each round is force-crashed at, inf where the
+    forced crash never fires
+
+    The live game checks the potential win at the previous tick and
+    crashes at the current one.
+    """
+    order = np.argsort(cashouts, axis=1)
+    g = np.take_along_axis(cashouts, order, axis=1)
+    a = np.take_along_axis(amounts, order, axis=1)
+
+    # potential(m) = sum(a * min(m, g)) = cashed + still_open * m
+    still_open = np.cumsum(a[:, ::-1], axis=1)[:, ::-1]
+    cashed = np.cumsum(a * g, axis=1) - a * g
+    at_cashouts = cashed + still_open * g
+
+    crossed = at_cashouts > threshold[:, None]
+    fires = crossed.any(axis=1)
+    k = np.argmax(crossed, axis=1)
+    rows = np.arange(len(k))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        crossing = (threshold - cashed[rows, k]) / still_open[rows, k]
+
+    tick = np.searchsorted(grid, crossing, side="right")
+    forced = grid[np.minimum(tick + 1, len(grid) - 1)]
+    return np.where(fires, forced, np.inf)
+
+
+def simulate_paths(n_paths, n_rounds, population, house_balance, seed, sample_every):
+    rng = np.random.default_rng(seed)
+    grid = tick_grid()
+
+    sizes = [group["bettors"] for group in population]
+    mean_bets = np.repeat([group["mean_bet"] for group in population], sizes)
+    participation = np.repeat([group["participation"] for group in population], sizes)
+    n_bettors = int(sum(sizes))
+
+    house = np.full(n_paths, float(house_balance))
+    ruined = np.zeros(n_paths, dtype=bool)
+    ruin_round = np.full(n_paths, -1)
+    wagered = np.zeros(n_paths)
+    house_profit = np.zeros(n_paths)
+    forced_rounds = 0
+    rerolled_rounds = 0
+    played_rounds = 0
+    trajectory = []
+
+    for r in range(n_rounds):
+        active = ~ruined
+        playing = (rng.random((n_paths, n_bettors)) < participation) & active[:, None]
+        amounts = rng.exponential(mean_bets, (n_paths, n_bettors)) * playing
+        targets = np.concatenate(
+            [STRATEGIES[group["strategy"]](rng, (n_paths, group["bettors"]), group) for group in population],
+            axis=1,
+        )
+        cashouts = grid[np.minimum(np.searchsorted(grid, targets), len(grid) - 1)]
+
+        total_bets = amounts.sum(axis=1)
+        threshold = forced_crash_threshold(house, total_bets)
+        crash = crash_points(rng, n_paths)
+        forced = forced_crash_points(grid, amounts, cashouts, threshold)
+        final = np.minimum(crash, forced)
+
+        won = playing & (cashouts < final[:, None])
+        profit = total_bets - (amounts * cashouts * won).sum(axis=1)
+        last_open = np.where(playing, cashouts, 0).max(axis=1)
+
+        house += profit * active
+        wagered += total_bets
+        house_profit += profit * active
+        forced_rounds += int((active & (forced < crash)).sum())
+        rerolled_rounds += int((active & (forced >= crash) & (crash > REROLL_ABOVE) & (last_open < crash)).sum())
+        played_rounds += int(active.sum())
+
+        newly_ruined = active & (house <= 0)
+        ruined |= newly_ruined
+        ruin_round[newly_ruined] = r
+
+        if r % sample_every == 0 or r == n_rounds - 1:
+            trajectory.append((r, house.copy()))
+
+    return {
+        "house": house,
+        "ruin_round": ruin_round,
+        "wagered": wagered,
+        "house_profit": house_profit,
+        "forced_rounds": forced_rounds,
+        "rerolled_rounds": rerolled_rounds,
+        "played_rounds": played_rounds,
+        "trajectory": trajectory,
+    }
+
+
+def _simulate_chunk(args):
+    return simulate_paths(*args)
+
+
+def run(n_paths, n_rounds, population=None, house_balance=STARTING_WALLET_AMT, workers=1, seed=None, sample_every=100):
+    """
+    Simulates n_paths independent houses over n_rounds rounds each and
+    returns the summary report
+    """
+    population = population or DEFAULT_POPULATION
+    for group in population:
+        if group["strategy"] not in STRATEGIES:
+            raise ValueError(f"Unknown cashout strategy '{group['strategy']}'")
+
+    workers = max(1, min(workers, n_paths))
+    seeds = np.random.SeedSequence(seed).spawn(workers)
+    chunks = [
+        (len(paths), n_rounds, population, house_balance, child, sample_every)
+        for paths, child in zip(np.array_split(np.arange(n_paths), workers), seeds)
+    ]
+
+    start = time.perf_counter()
+    if workers == 1:
+        results = [_simulate_chunk(chunks[0])]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_simulate_chunk, chunks))
+    elapsed = time.perf_counter() - start
+
+    house = np.concatenate([res["house"] for res in results])
+    ruin_round = np.concatenate([res["ruin_round"] for res in results])
+    wagered = sum(float(res["wagered"].sum()) for res in results)
+    house_profit = sum(float(res["house_profit"].sum()) for res in results)
+    played = sum(res["played_rounds"] for res in results)
+
+    trajectory = []
+    for i, (r, _) in enumerate(results[0]["trajectory"]):
+        balances = np.concatenate([res["trajectory"][i][1] for res in results])
+        p5, p50, p95 = np.percentile(balances, [5, 50, 95])
+        trajectory.append({"round": r, "p5": round(float(p5), 2), "p50": round(float(p50), 2), "p95": round(float(p95), 2)})
+
+    ruined = ruin_round >= 0
+    return {
+        "paths": n_paths,
+        "rounds": n_rounds,
+        "startingBalance": house_balance,
+        "ruinProbability": float(ruined.mean()),
+        "meanRuinRound": float(ruin_round[ruined].mean()) if ruined.any() else None,
+        "realizedEdge": house_profit / wagered if wagered else 0.0,
+        "forcedCrashRate": sum(res["forced_rounds"] for res in results) / played if played else 0.0,
+        "rerollRate": sum(res["rerolled_rounds"] for res in results) / played if played else 0.0,
+        "finalBalance": dict(zip(["p5", "p50", "p95"], np.round(np.percentile(house, [5, 50, 95]), 2).tolist())),
+        "trajectory": trajectory,
+        "elapsedSeconds": round(elapsed, 3),
+        "roundsPerSecond": round(n_paths * n_rounds / elapsed, 1) if elapsed else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paths", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=10000)
+    parser.add_argument("--house-balance", type=float, default=STARTING_WALLET_AMT)
+    parser.add_argument("--population", help="JSON file with a list of bettor groups, see DEFAULT_POPULATION")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--sample-every", type=int, default=100)
+    parser.add_argument("--out", help="write the full report, trajectories included, to this file")
+    args = parser.parse_args()
+
+    population = None
+    if args.population:
+        with open(args.population) as f:
+            population = json.load(f)
+
+    report = run(
+        args.paths,
+        args.rounds,
+        population=population,
+        house_balance=args.house_balance,
+        workers=args.workers,
+        seed=args.seed,
+        sample_every=args.sample_every,
+    )
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+    summary = {key: value for key, value in report.items() if key != "trajectory"}
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
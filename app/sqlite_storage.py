@@ -0,0 +1,198 @@
+"""
+Embedded SQLite storage backend.
+
+Selected with STORAGE_BACKEND=sqlite. SQLITE_PATH is a database file, or
+":memory:" for a throwaway database, so a Game can be started for tests,
+benchmarks or small deployments without a Postgres server.
+"""
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+from database import ElrondCrashDatabase, SETTLED_SQL
+from vars import GAMES_TABLE_NAME, BETS_TABLE_NAME, USERS_TABLE_NAME, SQLITE_PATH
+
+logger = logging.getLogger("fastapi")
+logger.setLevel(logging.DEBUG)
+
+SCHEMAS = {
+    GAMES_TABLE_NAME: [
+        ("id", "INTEGER"),
+        ("timestamp", "TEXT"),
+        ("hash", "TEXT"),
+        ("tx_hash", "TEXT"),
+        ("pool_size", "REAL"),
+        ("multiplier", "REAL"),
+        ("house_profit", "REAL"),
+        ("house_balance", "REAL"),
+    ],
+    BETS_TABLE_NAME: [
+        ("timestamp", "TEXT"),
+        ("hash", "TEXT"),
+        ("address", "TEXT"),
+        ("amount", "REAL"),
+        ("haswon", "BOOLEAN"),
+        ("multiplier", "REAL"),
+        ("profit", "REAL"),
+        ("status", "TEXT"),
+    ],
+    USERS_TABLE_NAME: [
+        ("id", "INTEGER"),
+        ("timestamp", "TEXT"),
+        ("address", "TEXT"),
+        ("discord_name", "TEXT"),
+        ("discord_id", "INTEGER"),
+        ("avatar_hash", "TEXT"),
+        ("exp", "INTEGER"),
+        ("raffle_tickets", "INTEGER"),
+        ("is_private", "BOOLEAN"),
+        ("has_title", "BOOLEAN"),
+        ("title", "TEXT"),
+    ],
+}
+
+
+class SQLitePool:
+    """
+    A single SQLite connection shared by the query threads.
+
+    Operations are serialized by a lock, which SQLite does for writes
+    anyway, and an in-memory database only exists within one connection.
+    Exposes the same connection() and metrics() as ConnectionPool.
+    """
+
+    def __init__(self, path=SQLITE_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.waits = 0
+
+    @contextmanager
+    def connection(self):
+        if not self.lock.acquire(blocking=False):
+            self.waits += 1
+            self.lock.acquire()
+
+        try:
+            self.checkouts += 1
+            yield self.conn
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        finally:
+            self.lock.release()
+
+    def metrics(self):
+        return {
+            "size": 1,
+            "in_use": int(self.lock.locked()),
+            "checkouts": self.checkouts,
+            "waits": self.waits,
+            "reconnects": 0,
+        }
+
+    def close(self):
+        self.conn.close()
+
+
+class SQLiteDatabase(ElrondCrashDatabase):
+    """
+    ElrondCrashDatabase on SQLite. Queries keep the %s placeholders of
+    the Postgres backend and are translated here. Timestamps are stored
+    as ISO strings and read back as datetimes.
+    """
+
+    def __init__(self, path=SQLITE_PATH):
+        self.path = path
+        super().__init__()
+        for table, cols in SCHEMAS.items():
+            self.create_table(table, [{"name": name, "dtype": dtype} for name, dtype in cols])
+
+    def _connect(self):
+        return SQLitePool(self.path)
+
+    def ensure_indexes(self):
+        self.execute(
+            f"CREATE INDEX IF NOT EXISTS {BETS_TABLE_NAME}_address_timestamp_idx "
+            f"ON {BETS_TABLE_NAME} (address, timestamp DESC);"
+        )
+
+    def create_table(self, table: str, cols: list, pkey=False):
+        columns = ", ".join(
+            f"{col['name']} {col['dtype']}{' PRIMARY KEY' if pkey and i == 0 else ''}" for i, col in enumerate(cols)
+        )
+        self.execute(f"CREATE TABLE IF NOT EXISTS {table}({columns});")
+
+    def execute(self, sql, params=()):
+        with self.connection("execute") as conn:
+            cur = conn.execute(_placeholders(sql), _params(params))
+            if cur.description is None:
+                return []
+            return cur.fetchall()
+
+    def add_row(self, table, data):
+        self.add_rows(table, [data])
+        logger.info(f"Adding row to '{table}':\t{data}")
+
+    def add_rows(self, table, rows, page_size=1000):
+        if not rows:
+            return
+
+        with self.connection("add_rows") as conn:
+            _insert(conn, table, rows)
+        logger.info(f"Adding {len(rows)} rows to '{table}'")
+
+    def save_round(
+            self, game_row, bet_rows, games_table=GAMES_TABLE_NAME, bets_table=BETS_TABLE_NAME, settlement_id=None
+    ):
+        with self.connection("save_round") as conn:
+            _insert(conn, games_table, [game_row])
+            if bet_rows:
+                _insert(conn, bets_table, bet_rows)
+            if settlement_id is not None:
+                conn.execute(_placeholders(SETTLED_SQL), (settlement_id,))
+        logger.info(f"Saved round to '{games_table}' with {len(bet_rows)} rows in '{bets_table}'")
+
+    def remove_by(self, table, condition):
+        self.execute(f"DELETE FROM {table} where {condition};")
+
+    def read_sql(self, sql, params=None):
+        with self.connection("read_sql") as conn:
+            df = pd.read_sql_query(_placeholders(sql), conn, params=_params(params or ()))
+        if "timestamp" in df.columns:
+            # rows written with and without microseconds mix two formats,
+            # which pandas only infers per value before 2.0
+            df["timestamp"] = pd.to_datetime(df["timestamp"].map(_timestamp))
+        return df
+
+
+def _timestamp(value):
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _insert(conn, table, rows):
+    placeholders = ", ".join(["?"] * len(rows[0]))
+    conn.executemany(f"INSERT INTO {table} VALUES ({placeholders})", [_params(row) for row in rows])
+
+
+def _placeholders(sql):
+    return sql.replace("%s", "?")
+
+
+def _params(values):
+    return tuple(_param(value) for value in values)
+
+
+def _param(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
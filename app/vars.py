@@ -4,12 +4,40 @@ import os
 load_dotenv()
 DELAY = 0.025
 BETTING_DELAY = 5
-BETTING_STAGE_DURATION = 30
+TICK_INTERVAL = 0.05
+BETTING_STAGE_DURATION = int(os.getenv("BETTING_STAGE_DURATION", 30))
 DATABASE_PATH = "db-crash-game"
 STARTING_WALLET_AMT = 100
+MAX_CRASH_MULTIPLIER = 500
+HASH_CHAIN_PATH = os.getenv("HASH_CHAIN_PATH", "hashchain.npy")
+VERIFY_BATCH_SIZE = 100000
+VERIFY_WORKERS = os.cpu_count() or 1
+VERIFY_MAX_GAMES = 1000000
+# verifications running or queued on the server before /verifyGames answers 429
+VERIFY_MAX_PENDING = int(os.getenv("VERIFY_MAX_PENDING", 4))
+GAMES_HISTORY_WINDOW = 1000
+BETS_HISTORY_WINDOW = 50000
+USERS_HISTORY_WINDOW = 10000
+PLAYER_CACHE_SIZE = 10000
+DB_POOL_MIN = 1
+DB_POOL_MAX = 10
+DB_HEALTHCHECK_INTERVAL = 30
+STARTUP_RETRY_DELAY = 5
+SETTLEMENT_RETRY_DELAY = 2
+PAYOUT_CHUNK_SIZE = int(os.getenv("PAYOUT_CHUNK_SIZE", 50))
+PAYOUT_CONFIRM_TIMEOUT = int(os.getenv("PAYOUT_CONFIRM_TIMEOUT", 180))
+# seconds past the betting deadline a payout may take before /ready reports it
+SETTLEMENT_STALL_TIMEOUT = int(os.getenv("SETTLEMENT_STALL_TIMEOUT", 300))
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "postgres")
+SQLITE_PATH = os.getenv("SQLITE_PATH", ":memory:")
+GATEWAY_TIMEOUT = 10
+GATEWAY_MAX_CONNECTIONS = 20
+GATEWAY_MAX_KEEPALIVE = 10
+GATEWAY_CONCURRENCY = 10
+BROADCAST_TIMESTAMPS = os.getenv("BROADCAST_TIMESTAMPS") == "1"
 SALT_HASH = os.getenv("HASH")
 DB_HOST = os.getenv("DB_HOST")
-DB_PORT = int(os.getenv("DB_PORT"))
+DB_PORT = int(os.getenv("DB_PORT", 5432))
 DB_PASS = os.getenv("DB_PASS")
 DB_USER = os.getenv("DB_USER")
 ENV = os.getenv("ENV")
@@ -54,13 +82,15 @@ if ENV == "prod":
     GAMES_TABLE_NAME = "games_2023"
     BETS_TABLE_NAME = "bets"
     USERS_TABLE_NAME = "users_dev"
+    SETTLEMENTS_TABLE_NAME = "settlements"
     CHAIN_ID = "D"
-    ELROND_API = 'https://devnet-api.multiversx.com'
-    ELROND_GATEWAY = 'https://devnet-gateway.multiversx.com'
+    ELROND_API = os.getenv("ELROND_API", 'https://devnet-api.multiversx.com')
+    ELROND_GATEWAY = os.getenv("ELROND_GATEWAY", 'https://devnet-gateway.multiversx.com')
 else:
     GAMES_TABLE_NAME = "games_2023"
     BETS_TABLE_NAME = "bets"
     USERS_TABLE_NAME = "users_dev"
+    SETTLEMENTS_TABLE_NAME = "settlements"
     CHAIN_ID = "D"
-    ELROND_API = 'https://devnet-api.multiversx.com'
-    ELROND_GATEWAY = 'https://devnet-gateway.multiversx.com'
+    ELROND_API = os.getenv("ELROND_API", 'https://devnet-api.multiversx.com')
+    ELROND_GATEWAY = os.getenv("ELROND_GATEWAY", 'https://devnet-gateway.multiversx.com')
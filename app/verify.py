@@ -0,0 +1,322 @@
+"""
+Bulk provably-fair verification of saved games.
+
+For every stored game the next hash is recomputed from the previous
+game's hash (HMAC-SHA256, spread over a process pool) and the crash point
+is recomputed from the game's own hash with NumPy. Results are compared
+against the games table and every row is put in one category:
+
+    ok           hash and multiplier match the chain
+    skipped      the hash is a few links ahead because the rounds in
+                 between crashed above MAX_CRASH_MULTIPLIER and were skipped
+    rerolled     a multiplier above REROLL_ABOVE was replaced within REROLL_RANGE
+    forced       the round crashed below its crash point (house protection)
+    mismatch     anything else
+
+    python -m verify --from-id 1 --to-id 1000000
+    python -m verify --start-hash <hash> --count 100000
+
+The /verifyGames endpoint runs through the verifications singleton: one
+job at a time, on its own thread and a long-lived process pool, so a
+verification never takes a query thread or a database connection the
+game needs.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import nullcontext
+
+import numpy as np
+
+from hashchain import get_result
+from rules import REROLL_ABOVE, REROLL_RANGE
+from vars import (
+    GAMES_TABLE_NAME,
+    MAX_CRASH_MULTIPLIER,
+    SALT_HASH,
+    VERIFY_BATCH_SIZE,
+    VERIFY_WORKERS,
+    VERIFY_MAX_PENDING,
+)
+
+logger = logging.getLogger("fastapi")
+logger.setLevel(logging.DEBUG)
+
+E = 2 ** 52
+MAX_SKIPPED_LINKS = 10
+MAX_REPORTED_MISMATCHES = 100
+# 256 ** k % 33 for each digest byte, most significant first, so the
+# "% 33" instant-crash test becomes a dot product
+MOD33_WEIGHTS = np.array([pow(256, 31 - k, 33) for k in range(32)], dtype=np.int64)
+
+
+def hash_links(parents):
+    """
+    Returns the concatenated 32-byte digests following each parent hash
+    """
+    return b"".join(bytes.fromhex(get_result(parent)[0]) for parent in parents)
+
+
+def to_digests(hashes):
+    """
+    Returns an (N, 32) uint8 array from a list of hex hashes
+    """
+    return np.frombuffer(bytes.fromhex("".join(hashes)), dtype=np.uint8).reshape(-1, 32)
+
+
+def multipliers(digests):
+    """
+    Vectorized crash points of a (N, 32) uint8 digest array, identical to
+    hashchain.get_result
+    """
+    instant = (digests.astype(np.int64) @ MOD33_WEIGHTS) % 33 == 0
+
+    # first 13 hex digits = first 52 bits
+    h = np.zeros(len(digests), dtype=np.int64)
+    for k in range(7):
+        h = (h << 8) | digests[:, k].astype(np.int64)
+    h >>= 4
+
+    num = 100 * E - h
+    den = E - h
+    result = (num // den) / 100.0
+
+    # get_result floors a rounded float quotient; where the exact quotient
+    # sits within rounding distance of the next integer, redo it exactly
+    rem = num % den
+    close = (den - rem) / den < (num // den + 1) * 2.0 ** -50
+    for i in np.flatnonzero(close & ~instant):
+        result[i] = ((100 * E - int(h[i])) / (E - int(h[i])) // 1) / 100.0
+
+    result[instant] = 1
+    return result
+
+
+class GameVerifier:
+    """
+    Recomputes stored games in batches of ids and keeps the running report
+    """
+
+    def __init__(self, db, table=GAMES_TABLE_NAME, workers=VERIFY_WORKERS, batch_size=VERIFY_BATCH_SIZE, pool=None):
+        self.db = db
+        self.table = table
+        self.workers = workers
+        self.batch_size = batch_size
+        # a shared process pool, or None for one per verification
+        self.pool = pool
+
+    def verify_range(self, from_id, to_id):
+        parent = self._hash_before(from_id)
+        return self._verify(parent, from_id, to_id)
+
+    def verify_from_hash(self, start_hash, count):
+        """
+        Verifies count games after the game whose hash is start_hash. A hash
+        that is not in the table is taken as the chain seed.
+        """
+        df = self.db.read_sql(f"SELECT id FROM {self.table} WHERE hash = %s LIMIT 1", (start_hash,))
+        if df.empty:
+            df = self.db.read_sql(f"SELECT MIN(id) AS id FROM {self.table}")
+            from_id = int(df["id"].values[0])
+        else:
+            from_id = int(df["id"].values[0]) + 1
+        return self._verify(start_hash, from_id, from_id + count - 1)
+
+    def _hash_before(self, game_id):
+        df = self.db.read_sql(
+            f"SELECT hash FROM {self.table} WHERE id < %s ORDER BY id DESC LIMIT 1", (game_id,)
+        )
+        if df.empty:
+            return SALT_HASH
+        return df["hash"].values[0]
+
+    def _verify(self, parent, from_id, to_id):
+        report = {
+            "fromId": from_id,
+            "toId": to_id,
+            "checked": 0,
+            "ok": 0,
+            "skipped": 0,
+            "rerolled": 0,
+            "forced": 0,
+            "mismatch": 0,
+            "mismatches": [],
+        }
+        start = time.perf_counter()
+
+        with nullcontext(self.pool) if self.pool is not None else ProcessPoolExecutor(self.workers) as pool:
+            batch_start = from_id
+            while batch_start <= to_id:
+                batch_end = min(batch_start + self.batch_size - 1, to_id)
+                df = self.db.read_sql(
+                    f"SELECT id, hash, multiplier FROM {self.table} WHERE id BETWEEN %s AND %s ORDER BY id",
+                    (batch_start, batch_end),
+                )
+                if not df.empty:
+                    parent = self._verify_batch(pool, parent, df, report)
+                batch_start = batch_end + 1
+
+        elapsed = time.perf_counter() - start
+        report["elapsedSeconds"] = round(elapsed, 3)
+        report["gamesPerSecond"] = round(report["checked"] / elapsed, 1) if elapsed else 0
+        logger.info(f"Verified {report['checked']} games, {report['mismatch']} mismatches, {report['gamesPerSecond']} games/s")
+        return report
+
+    def _verify_batch(self, pool, parent, df, report):
+        ids = df["id"].values
+        hashes = df["hash"].tolist()
+        stored = df["multiplier"].values.astype(np.float64)
+        parents = [parent] + hashes[:-1]
+
+        chunk = -(-len(parents) // self.workers)
+        chunks = [parents[i: i + chunk] for i in range(0, len(parents), chunk)]
+        linked = np.frombuffer(b"".join(pool.map(hash_links, chunks)), dtype=np.uint8).reshape(-1, 32)
+        digests = to_digests(hashes)
+
+        hash_ok = np.all(linked == digests, axis=1)
+        expected = multipliers(digests)
+        mult_ok = np.abs(stored - expected) < 0.005
+        rerolled = (
+            ~mult_ok & (expected > REROLL_ABOVE) & (stored >= REROLL_RANGE[0]) & (stored <= REROLL_RANGE[1])
+        )
+        forced = ~mult_ok & ~rerolled & (stored < expected)
+
+        skipped = np.zeros(len(ids), dtype=bool)
+        for i in np.flatnonzero(~hash_ok):
+            skipped[i] = self._is_skip(parents[i], hashes[i])
+
+        link_ok = hash_ok | skipped
+        categories = {
+            "ok": hash_ok & mult_ok,
+            "skipped": skipped & mult_ok,
+            "rerolled": link_ok & rerolled,
+            "forced": link_ok & forced,
+        }
+        bad = ~link_ok | ~(mult_ok | rerolled | forced)
+
+        for name, mask in categories.items():
+            report[name] += int(mask.sum())
+        report["mismatch"] += int(bad.sum())
+        report["checked"] += len(ids)
+
+        room = MAX_REPORTED_MISMATCHES - len(report["mismatches"])
+        for i in np.flatnonzero(bad)[:max(room, 0)]:
+            report["mismatches"].append(
+                {
+                    "id": int(ids[i]),
+                    "hash": hashes[i],
+                    "hashMatches": bool(link_ok[i]),
+                    "multiplier": float(stored[i]),
+                    "expectedMultiplier": float(expected[i]),
+                }
+            )
+
+        return hashes[-1]
+
+    @staticmethod
+    def _is_skip(parent, game_hash):
+        """
+        True if game_hash is reached from parent only through rounds that
+        crashed above MAX_CRASH_MULTIPLIER
+        """
+        next_hash, multiplier = get_result(parent)
+        for _ in range(MAX_SKIPPED_LINKS):
+            if multiplier <= MAX_CRASH_MULTIPLIER:
+                return False
+            next_hash, multiplier = get_result(next_hash)
+            if next_hash == game_hash:
+                return True
+        return False
+
+
+class VerificationRunner:
+    """
+    Runs GameVerifier jobs for the server, one at a time. Jobs wait in
+    line on a single thread; once max_pending are running or waiting,
+    run() raises VerificationBusy. The process pool is started on the
+    first job and reused; its workers are spawned, not forked from the
+    threaded server process.
+    """
+
+    def __init__(self, workers=VERIFY_WORKERS, max_pending=VERIFY_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="verify")
+        self.pool = None
+
+    def verifier(self, db):
+        if self.pool is None:
+            pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            setattr(self, "pool", pool)
+        return GameVerifier(db, workers=self.workers, pool=self.pool)
+
+    async def run(self, db, method, *args):
+        """
+        Queues GameVerifier(db).<method>(*args), e.g.
+        await verifications.run(db, "verify_range", 1, 1000)
+
+        Returns:
+            The verification report
+        """
+        if self.pending >= self.max_pending:
+            raise VerificationBusy(f"{self.pending} verifications are already queued")
+
+        setattr(self, "pending", self.pending + 1)
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, self._run, db, method, args)
+        finally:
+            setattr(self, "pending", self.pending - 1)
+
+    def _run(self, db, method, args):
+        try:
+            return getattr(self.verifier(db), method)(*args)
+        except BrokenProcessPool:
+            # a worker died, the next job starts a new pool
+            self.pool.shutdown(wait=False)
+            setattr(self, "pool", None)
+            raise
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+        if self.pool is not None:
+            self.pool.shutdown(wait=False)
+
+
+class VerificationBusy(Exception):
+    pass
+
+
+verifications = VerificationRunner()
+
+
+def main():
+    from database import open_storage
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--from-id", type=int)
+    parser.add_argument("--to-id", type=int)
+    parser.add_argument("--start-hash")
+    parser.add_argument("--count", type=int, default=VERIFY_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=VERIFY_WORKERS)
+    args = parser.parse_args()
+
+    verifier = GameVerifier(open_storage(), workers=args.workers)
+    if args.start_hash:
+        report = verifier.verify_from_hash(args.start_hash, args.count)
+    elif args.from_id is not None and args.to_id is not None:
+        report = verifier.verify_range(args.from_id, args.to_id)
+    else:
+        parser.error("give --from-id and --to-id, or --start-hash")
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()